@@ -1,23 +1,32 @@
 import os
-import pygame
+import argparse
+import csv
+import copy
+import gzip
+import heapq
+import pickle
 import random
 import sys
 import math
 import time
 import threading
-import tkinter as tk
-from tkinter import messagebox
+import itertools
+import multiprocessing
 import neat
 import numpy as np
-import matplotlib.pyplot as plt
 from collections import deque
 
 
-pygame.init()
-
 width, height = 800, 600
-screen = pygame.display.set_mode((width, height))
-pygame.display.set_caption("Bumblebee Foraging Simulation")
+screen = None
+renderer = None
+# Bound by init_display, so headless runs and pool workers never import pygame
+pygame = None
+
+
+# Headless mode runs the simulation without a display, Tk panel or frame cap. Code that
+# imports this module stays headless until init_display opens a window
+headless = True
 
 WHITE = (255, 255, 255)
 PINK = (255, 105, 180)
@@ -28,24 +37,175 @@ YELLOW = (255, 255, 0)
 SPECIAL_FLOWER_COLOR = (0, 0, 255)
 BEE_COLOR = (255, 165, 0)
 OBSTACLE_COLOR = (128, 128, 128)
+# Marks transparent cells of the pheromone overlay and transparent pixels of cached render layers
+PHEROMONE_COLORKEY = (255, 0, 255)
 
 
-flowers = []
-special_flowers = []
-
-target_full_hive_bouts = 10
-foraging_efficiency = []
-search_efficiency = []
-weather_changes_enabled = False
-rain_enabled = False
-dying_flowers_enabled = False
-random_spawn_flowers_enabled = False
-random_spawn_despawn_enabled = False
-random_obstacles_enabled = False
-obstacles_enabled = False
 visualize_fov = False
 visualize_pheromones = False
-evaporation_rate = 0.010
+
+# Rendered frames per second, and simulation steps advanced per rendered frame (fast-forward)
+frame_rate = 30
+steps_per_frame = 1
+max_steps_per_frame = 1024
+# With a display, only every k-th genome of every k-th generation is drawn; the rest run
+# unrendered in chunks of unrendered_steps, checking for window events between chunks
+render_genome_interval = 1
+render_generation_interval = 1
+unrendered_steps = 500
+
+# Durations are measured in simulation ticks, 1/30 s each at the default frame rate and one step per frame
+hive_rest_ticks = 5 * 30
+weather_period_ticks = 20 * 30
+# Ranges the gap between two dying or two spawning flower events is drawn from
+flower_death_interval_ticks = (1 * 30, 3 * 30)
+flower_spawn_interval_ticks = (2 * 30, 5 * 30)
+
+
+def init_display():
+    global screen, renderer, pygame, headless
+    import pygame
+    headless = False
+    pygame.init()
+    screen = pygame.display.set_mode((width, height))
+    pygame.display.set_caption("Bumblebee Foraging Simulation")
+    renderer = SceneRenderer()
+
+
+# Simulation clock shared by the whole engine so runs don't depend on wall-clock time
+class SimulationClock:
+    def __init__(self):
+        self.tick = 0
+
+    def advance(self):
+        self.tick += 1
+
+    def reset(self):
+        self.tick = 0
+
+
+# Memoizes query results until they are explicitly invalidated
+class QueryCache:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key, compute):
+        if key not in self.values:
+            self.values[key] = compute()
+        return self.values[key]
+
+    def invalidate(self, key=None):
+        if key is None:
+            self.values.clear()
+        else:
+            self.values.pop(key, None)
+
+
+# Priority queue of named events on simulation ticks. Scheduling an event under a name that is
+# already pending replaces it; cancelled entries stay in the heap and are skipped when popped
+class EventScheduler:
+    def __init__(self):
+        self.queue = []
+        self.pending = {}
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def schedule(self, tick, name, event):
+        self.cancel(name)
+        entry = [tick, next(self.counter), name, event]
+        self.pending[name] = entry
+        heapq.heappush(self.queue, entry)
+
+    def cancel(self, name):
+        entry = self.pending.pop(name, None)
+        if entry is not None:
+            entry[3] = None
+
+    def clear(self):
+        self.queue.clear()
+        self.pending.clear()
+
+    # Calls event(world) for every event due by tick, in tick then scheduling order
+    def run_due(self, world, tick):
+        while self.queue and self.queue[0][0] <= tick:
+            entry = heapq.heappop(self.queue)
+            event = entry[3]
+            if event is None:
+                continue
+            del self.pending[entry[2]]
+            event(world)
+
+
+# Swarm-wide totals kept up to date by the bees as they move, visit flowers, change speed and
+# finish bouts, so per-tick checks and the HUD read them without reducing over every bee.
+# bout_counts[n] is the number of bees that completed n foraging bouts
+class SwarmTotals:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.bees = 0
+        self.nectar = 0
+        self.flowers_visited = 0
+        self.distance = 0
+        self.speed = 0
+        self.bout_counts = [0]
+        self.min_bouts = 0
+
+    def add_bees(self, count, speed):
+        self.bees += count
+        self.speed += speed
+        self.bout_counts[0] += count
+        self.min_bouts = 0
+
+    # A bee that had completed bouts foraging bouts finished another one
+    def complete_bout(self, bouts):
+        if bouts + 1 == len(self.bout_counts):
+            self.bout_counts.append(0)
+        self.bout_counts[bouts] -= 1
+        self.bout_counts[bouts + 1] += 1
+        while self.bout_counts[self.min_bouts] == 0:
+            self.min_bouts += 1
+
+
+# Keeps the most recent samples of a metric in a ring buffer, plus running
+# count, mean, variance, min and max over every sample recorded
+class MetricStream:
+    def __init__(self, capacity=1000):
+        self.samples = deque(maxlen=capacity)
+        self.clear()
+
+    def clear(self):
+        self.samples.clear()
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = float('inf')
+        self.maximum = float('-inf')
+
+    def append(self, value):
+        self.samples.append(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def summary(self):
+        return {'count': self.count, 'mean': self.mean, 'std': math.sqrt(self.variance()),
+                'min': self.minimum, 'max': self.maximum}
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __iter__(self):
+        return iter(self.samples)
 
 
 class Obstacle:
@@ -54,8 +214,8 @@ class Obstacle:
         self.y = y
         self.size = size
 
-    def draw(self):
-        pygame.draw.rect(screen, OBSTACLE_COLOR,
+    def draw(self, surface):
+        pygame.draw.rect(surface, OBSTACLE_COLOR,
                          pygame.Rect(self.x - self.size // 2, self.y - self.size // 2, self.size, self.size))
 
 
@@ -73,8 +233,8 @@ class Hive:
         return [(self.x + self.size * math.cos(i * angle),
                  self.y + self.size * math.sin(i * angle)) for i in range(6)]
 
-    def draw(self):
-        pygame.draw.polygon(screen, YELLOW, self.polygon)
+    def draw(self, surface):
+        pygame.draw.polygon(surface, YELLOW, self.polygon)
 
 
 # Environment class for managing pheromones, obstacles, and weather
@@ -85,14 +245,41 @@ class Environment:
         self.cell_size = cell_size
         self.grid = np.zeros((width // cell_size, height // cell_size))
         self.obstacles = []
+        # Bumped whenever obstacles are added or cleared, so cached render layers know to redraw
+        self.obstacle_version = 0
+        # One cell per pixel, True where an obstacle covers it
+        self.obstacle_grid = np.zeros((width, height), dtype=bool)
+        self.pheromone_surface = None
+        self.scaled_pheromone_surface = None
         self.weather = "clear"
 
-    def deposit_pheromone(self, x, y, amount):
-        i, j = int(x / self.cell_size), int(y / self.cell_size)
-        self.grid[i, j] += amount
+    # Positions outside the area are clipped to the nearest edge cell
+    def cell_index(self, x, y):
+        i = min(max(int(x / self.cell_size), 0), self.grid.shape[0] - 1)
+        j = min(max(int(y / self.cell_size), 0), self.grid.shape[1] - 1)
+        return i, j
 
-    def evaporate_pheromones(self, evaporation_rate):
-        self.grid *= (1 - evaporation_rate)
+    def cell_indices(self, xs, ys):
+        i = np.clip((np.asarray(xs) / self.cell_size).astype(int), 0, self.grid.shape[0] - 1)
+        j = np.clip((np.asarray(ys) / self.cell_size).astype(int), 0, self.grid.shape[1] - 1)
+        return i, j
+
+    def deposit_pheromone(self, x, y, amount):
+        self.grid[self.cell_index(x, y)] += amount
+
+    # Accumulates every deposit, including several landing in the same cell
+    def deposit_pheromones(self, xs, ys, amount):
+        np.add.at(self.grid, self.cell_indices(xs, ys), amount)
+
+    # Diffusion moves diffusion_rate of each cell's pheromone to its four neighbours (edges
+    # reflect, so none leaks out), then evaporation scales the field, in one array update
+    def update_pheromones(self, evaporation_rate, diffusion_rate=0.0):
+        if diffusion_rate > 0:
+            padded = np.pad(self.grid, 1, mode='edge')
+            neighbours = (padded[:-2, 1:-1] + padded[2:, 1:-1] + padded[1:-1, :-2] + padded[1:-1, 2:]) / 4
+            self.grid = (1 - evaporation_rate) * ((1 - diffusion_rate) * self.grid + diffusion_rate * neighbours)
+        else:
+            self.grid *= (1 - evaporation_rate)
 
     def reset_pheromones(self):
         self.grid = np.zeros(
@@ -100,27 +287,52 @@ class Environment:
         print("Pheromone trails have been reset.")
 
     def get_pheromone_level(self, x, y):
-        i, j = int(x / self.cell_size), int(y / self.cell_size)
-        return self.grid[i, j]
+        return self.grid[self.cell_index(x, y)]
+
+    def get_pheromone_levels(self, xs, ys):
+        return self.grid[self.cell_indices(xs, ys)]
 
     def add_obstacle(self, x, y, size):
         self.obstacles.append(Obstacle(x, y, size))
+        self.obstacle_version += 1
+        half = size // 2
+        left, top = max(0, math.floor(x - half)), max(0, math.floor(y - half))
+        right, bottom = max(0, math.ceil(x + half)), max(0, math.ceil(y + half))
+        self.obstacle_grid[left:right, top:bottom] = True
 
     def clear_obstacles(self):
         self.obstacles.clear()
+        self.obstacle_version += 1
+        self.obstacle_grid[:] = False
 
     def is_obstacle(self, x, y):
+        i, j = math.floor(x), math.floor(y)
+        if 0 <= i < self.width and 0 <= j < self.height:
+            return bool(self.obstacle_grid[i, j])
+        return self.scan_obstacles(x, y)
+
+    # Exact check against the obstacle list, for points outside the occupancy grid
+    def scan_obstacles(self, x, y):
         for obstacle in self.obstacles:
             if abs(x - obstacle.x) < obstacle.size // 2 and abs(y - obstacle.y) < obstacle.size // 2:
                 return True
         return False
 
-    def update_weather(self):
-        global weather_changes_enabled, rain_enabled
+    def is_obstacle_batch(self, xs, ys):
+        i = np.floor(xs).astype(int)
+        j = np.floor(ys).astype(int)
+        inside = (i >= 0) & (i < self.width) & (j >= 0) & (j < self.height)
+        blocked = np.zeros(len(i), dtype=bool)
+        blocked[inside] = self.obstacle_grid[i[inside], j[inside]]
+        for k in np.flatnonzero(~inside):
+            blocked[k] = self.scan_obstacles(xs[k], ys[k])
+        return blocked
+
+    def update_weather(self, tick, weather_changes_enabled, rain_enabled):
         if rain_enabled:
             self.weather = "rainy"
         elif weather_changes_enabled:
-            if int(time.time()) % 20 < 10:
+            if tick % weather_period_ticks < weather_period_ticks // 2:
                 self.weather = "clear"
             else:
                 self.weather = "rainy"
@@ -130,70 +342,112 @@ class Environment:
     def get_weather(self):
         return self.weather
 
-    def draw_obstacles(self):
+    def draw_obstacles(self, surface):
         for obstacle in self.obstacles:
-            obstacle.draw()
+            obstacle.draw(surface)
 
+    # Maps the whole grid to colors in one pass, one pixel per cell, then scales it up to cell size
     def draw_pheromones(self):
         if visualize_pheromones:
-            for i in range(self.grid.shape[0]):
-                for j in range(self.grid.shape[1]):
-                    pheromone_level = self.grid[i, j]
-                    if pheromone_level > 0.001:
-                        intensity = min(int(pheromone_level * 255), 255)
-                        color = (0, intensity, 0)
-                        pygame.draw.rect(screen, color,
-                                         pygame.Rect(i * self.cell_size, j * self.cell_size, self.cell_size,
-                                                     self.cell_size), 0)
+            grid_size = self.grid.shape
+            scaled_size = (grid_size[0] * self.cell_size, grid_size[1] * self.cell_size)
+            if self.pheromone_surface is None or self.pheromone_surface.get_size() != grid_size:
+                self.pheromone_surface = pygame.Surface(grid_size)
+                self.scaled_pheromone_surface = pygame.Surface(scaled_size)
+                self.scaled_pheromone_surface.set_colorkey(PHEROMONE_COLORKEY)
 
+            colors = np.empty(grid_size + (3,), dtype=np.uint8)
+            colors[:] = PHEROMONE_COLORKEY
+            visible = self.grid > 0.001
+            colors[visible, 0] = 0
+            colors[visible, 1] = np.minimum(self.grid[visible] * 255, 255).astype(np.uint8)
+            colors[visible, 2] = 0
 
-environment = Environment(width, height, 20)
+            pygame.surfarray.blit_array(self.pheromone_surface, colors)
+            pygame.transform.scale(self.pheromone_surface, scaled_size, self.scaled_pheromone_surface)
+            screen.blit(self.scaled_pheromone_surface, (0, 0))
 
 
 class Bumblebee:
-    def __init__(self, flowers, special_flowers, hive, net):
-        self.x = random.randint(0, width)
-        self.y = random.randint(0, height)
+    __slots__ = ('world', 'environment', 'x', 'y', 'energy', 'speed', 'direction', 'flowers',
+                 'special_flowers', 'visited_mask', 'visited_count', 'route_length',
+                 'best_route_length', 'hive', 'at_hive', 'hive_arrival_tick', 'foraging_bouts',
+                 'net', 'total_nectar_collected', 'flowers_visited', 'total_distance_traveled',
+                 'fov_radius', 'tick_cache', 'totals')
+
+    def __init__(self, world, net):
+        self.world = world
+        self.environment = world.environment
+        self.x = world.rng.randint(0, width)
+        self.y = world.rng.randint(0, height)
         self.energy = 100
         self.speed = 2
-        self.direction = random.uniform(0, 2 * math.pi)
-        self.flowers = flowers
-        self.special_flowers = special_flowers
-        self.visited_flowers = set()
+        self.direction = world.rng.uniform(0, 2 * math.pi)
+        self.flowers = world.flowers
+        self.special_flowers = world.special_flowers
+        # Bit flower.id is set once the flower is visited in the current bout
+        self.visited_mask = 0
+        self.visited_count = 0
         self.route_length = 0
         self.best_route_length = float('inf')
-        self.hive = hive
+        self.hive = world.hive
         self.at_hive = False
-        self.hive_arrival_time = 0
+        self.hive_arrival_tick = 0
         self.foraging_bouts = 0
         self.net = net
         self.total_nectar_collected = 0
         self.flowers_visited = 0
         self.total_distance_traveled = 0
         self.fov_radius = 100
+        # Queries that stay valid until the bee moves or visits a flower
+        self.tick_cache = QueryCache()
+        self.totals = world.totals
+        self.totals.add_bees(1, self.speed)
 
     def update(self):
+        inputs = self.begin_update()
+        if inputs is not None:
+            self.finish_update(self.net.activate(inputs))
+
+    # First half of update: returns the network inputs, or None if the bee
+    # is resting or heading home this tick
+    def begin_update(self):
+        self.tick_cache.invalidate()
+
         if self.at_hive:
-            if time.time() - self.hive_arrival_time >= 5:
+            if self.world.clock.tick - self.hive_arrival_tick >= hive_rest_ticks:
                 self.at_hive = False
                 self.energy = 100
-            return
+            return None
 
-        environment.deposit_pheromone(self.x, self.y, 1.0)
+        self.environment.deposit_pheromone(self.x, self.y, 1.0)
 
-        if self.energy <= 0 or len(self.visited_flowers) == len(self.flowers) + len(self.special_flowers):
+        if self.heading_home():
             self.return_to_hive()
-            return
+            return None
 
-        if environment.get_weather() == "rainy":
-            self.speed = max(1, self.speed * 0.5)
+        if self.environment.get_weather() == "rainy":
+            self.set_speed(max(1, self.speed * 0.5))
             self.energy -= 0.15
             self.fov_radius = 60
         else:
             self.fov_radius = 100
 
-        inputs = self.get_inputs()
-        output = self.net.activate(inputs)
+        return self.get_inputs()
+
+    # A bee that visited a flower which then died stops counting it, so heading_home still
+    # fires once the surviving flowers are all visited, as it does in the vectorized engine
+    def forget_flower(self, flower):
+        if self.visited_mask >> flower.id & 1:
+            self.tick_cache.invalidate()
+            self.visited_mask &= ~(1 << flower.id)
+            self.visited_count -= 1
+
+    def heading_home(self):
+        return not self.at_hive and (
+            self.energy <= 0 or self.visited_count == len(self.flowers) + len(self.special_flowers))
+
+    def finish_update(self, output):
         self.process_output(output)
 
         nearest_flower = self.find_nearest_flower()
@@ -206,9 +460,9 @@ class Bumblebee:
         nearest_flower = self.find_nearest_flower()
         distance = self.distance_to(nearest_flower) if nearest_flower else 1.0
 
-        pheromone_level = environment.get_pheromone_level(self.x, self.y)
+        pheromone_level = self.environment.get_pheromone_level(self.x, self.y)
 
-        weather = environment.get_weather()
+        weather = self.environment.get_weather()
         weather_input = 1 if weather is None or weather == "clear" else 0
 
         nearest_landmark = self.find_nearest_flower_to_hive()
@@ -226,73 +480,70 @@ class Bumblebee:
         return inputs
 
     def find_nearest_flower_to_hive(self):
-        min_distance = float('inf')
-        nearest_flower = None
-        for flower in self.flowers + self.special_flowers:
-            distance = math.sqrt((self.hive.x - flower.x)
-                                 ** 2 + (self.hive.y - flower.y) ** 2)
-            if distance < min_distance:
-                min_distance = distance
-                nearest_flower = flower
-        return nearest_flower
+        return self.world.hive_landmark()
 
     def process_output(self, output):
         self.direction += output[0] * 2 * math.pi - math.pi
-        self.speed = max(1, min(5, self.speed + output[1] * 2 - 1))
+        self.set_speed(max(1, min(5, self.speed + output[1] * 2 - 1)))
+
+    def set_speed(self, speed):
+        self.totals.speed += speed - self.speed
+        self.speed = speed
 
     def find_nearest_flower(self):
-        min_distance = float('inf')
-        nearest_flower = None
+        return self.tick_cache.get('nearest_flower', self.search_nearest_flower)
 
-        for flower in self.special_flowers:
-            if flower not in self.visited_flowers:
-                distance = self.distance_to(flower)
-                if distance < min_distance:
-                    min_distance = distance
-                    nearest_flower = flower
+    def search_nearest_flower(self):
+        nearest_flower = self.world.special_flower_index.nearest(
+            self.x, self.y, self.visited_mask)
 
         if nearest_flower is None:
-            for flower in self.flowers:
-                if flower not in self.visited_flowers:
-                    distance = self.distance_to(flower)
-                    if distance < min_distance:
-                        min_distance = distance
-                        nearest_flower = flower
+            nearest_flower = self.world.flower_index.nearest(
+                self.x, self.y, self.visited_mask)
 
         return nearest_flower
 
     def move_towards(self, target):
         direction = math.atan2(target.y - self.y, target.x - self.x)
-        if environment.is_obstacle(self.x + self.speed * math.cos(direction),
-                                   self.y + self.speed * math.sin(direction)):
-            direction += random.uniform(-math.pi / 2,
-                                        math.pi / 2)
+        if self.environment.is_obstacle(self.x + self.speed * math.cos(direction),
+                                        self.y + self.speed * math.sin(direction)):
+            direction += self.world.rng.uniform(-math.pi / 2,
+                                                math.pi / 2)
+        self.tick_cache.invalidate()
 
         self.x += self.speed * math.cos(direction)
         self.y += self.speed * math.sin(direction)
         self.route_length += self.speed
         self.energy -= 0.1
         self.total_distance_traveled += self.speed
+        self.totals.distance += self.speed
 
     def visit_flower(self, flower):
-        self.visited_flowers.add(flower)
+        self.tick_cache.invalidate()
+        self.visited_mask |= 1 << flower.id
+        self.visited_count += 1
         self.energy += flower.nectar
         self.total_nectar_collected += flower.nectar
         self.flowers_visited += 1
+        self.totals.nectar += flower.nectar
+        self.totals.flowers_visited += 1
         if self.route_length < self.best_route_length:
             self.best_route_length = self.route_length
-            self.speed = min(self.speed * 1.1, 5)
+            self.set_speed(min(self.speed * 1.1, 5))
 
     def return_to_hive(self):
         if self.distance_to(self.hive) > 5:
             self.move_towards(self.hive)
-            environment.deposit_pheromone(self.x, self.y, 1.0)
+            self.environment.deposit_pheromone(self.x, self.y, 1.0)
         else:
-            self.visited_flowers.clear()
+            self.tick_cache.invalidate()
+            self.visited_mask = 0
+            self.visited_count = 0
             self.route_length = 0
             self.x, self.y = self.hive.x, self.hive.y
             self.at_hive = True
-            self.hive_arrival_time = time.time()
+            self.hive_arrival_tick = self.world.clock.tick
+            self.totals.complete_bout(self.foraging_bouts)
             self.foraging_bouts += 1
             self.hive.total_foraging_bouts += 1
 
@@ -313,34 +564,467 @@ class Bumblebee:
             pygame.draw.polygon(screen, (0, 0, 255, 50), points, 1)
 
 
+# Structure-of-arrays swarm engine: steps every bee of a world with batched NumPy operations.
+# Follows Bumblebee.update, except that all active bees deposit pheromone before any of them
+# senses it, instead of one bee at a time.
+class BeeSwarm:
+    def __init__(self, world, num_bees, net):
+        self.world = world
+        self.environment = world.environment
+        self.net = net
+        self.np_rng = np.random.default_rng(world.rng.getrandbits(64))
+
+        self.x = np.array([world.rng.randint(0, width) for _ in range(num_bees)], dtype=float)
+        self.y = np.array([world.rng.randint(0, height) for _ in range(num_bees)], dtype=float)
+        self.energy = np.full(num_bees, 100.0)
+        self.speed = np.full(num_bees, 2.0)
+        self.direction = np.array([world.rng.uniform(0, 2 * math.pi) for _ in range(num_bees)])
+        self.route_length = np.zeros(num_bees)
+        self.best_route_length = np.full(num_bees, np.inf)
+        self.at_hive = np.zeros(num_bees, dtype=bool)
+        self.hive_arrival_tick = np.zeros(num_bees, dtype=int)
+        self.foraging_bouts = np.zeros(num_bees, dtype=int)
+        self.total_nectar_collected = np.zeros(num_bees)
+        self.flowers_visited = np.zeros(num_bees, dtype=int)
+        self.total_distance_traveled = np.zeros(num_bees)
+        self.fov_radius = np.full(num_bees, 100.0)
+        self.totals = world.totals
+        self.totals.add_bees(num_bees, float(self.speed.sum()))
+
+        # Flower columns hold special flowers first, then normal ones
+        self.flower_list = []
+        self.visited = np.zeros((num_bees, 0), dtype=bool)
+        self.layout_version = None
+        self.sync_flowers()
+
+    def __len__(self):
+        return len(self.x)
+
+    def sync_flowers(self):
+        if self.layout_version == self.world.layout_version:
+            return
+        old_columns = {flower.id: i for i, flower in enumerate(self.flower_list)}
+        self.flower_list = self.world.special_flowers + self.world.flowers
+        self.flower_x = np.array([flower.x for flower in self.flower_list], dtype=float)
+        self.flower_y = np.array([flower.y for flower in self.flower_list], dtype=float)
+        self.flower_nectar = np.array([flower.nectar for flower in self.flower_list], dtype=float)
+        self.flower_special = np.array([flower.special for flower in self.flower_list], dtype=bool)
+
+        # Keep visited state for flowers that survived the layout change
+        visited = np.zeros((len(self), len(self.flower_list)), dtype=bool)
+        kept = [(i, old_columns[flower.id]) for i, flower in enumerate(self.flower_list)
+                if flower.id in old_columns]
+        if kept:
+            new_columns, previous_columns = zip(*kept)
+            visited[:, list(new_columns)] = self.visited[:, list(previous_columns)]
+        self.visited = visited
+
+        landmark = self.world.hive_landmark()
+        self.landmark = self.flower_list.index(landmark) if landmark is not None else None
+        self.layout_version = self.world.layout_version
+
+    def add_bee(self, x, y):
+        self.x = np.append(self.x, float(x))
+        self.y = np.append(self.y, float(y))
+        self.energy = np.append(self.energy, 100.0)
+        self.speed = np.append(self.speed, 2.0)
+        self.direction = np.append(self.direction, self.world.rng.uniform(0, 2 * math.pi))
+        self.route_length = np.append(self.route_length, 0.0)
+        self.best_route_length = np.append(self.best_route_length, np.inf)
+        self.at_hive = np.append(self.at_hive, False)
+        self.hive_arrival_tick = np.append(self.hive_arrival_tick, 0)
+        self.foraging_bouts = np.append(self.foraging_bouts, 0)
+        self.total_nectar_collected = np.append(self.total_nectar_collected, 0.0)
+        self.flowers_visited = np.append(self.flowers_visited, 0)
+        self.total_distance_traveled = np.append(self.total_distance_traveled, 0.0)
+        self.fov_radius = np.append(self.fov_radius, 100.0)
+        self.totals.add_bees(1, 2.0)
+        self.visited = np.vstack([self.visited, np.zeros((1, self.visited.shape[1]), dtype=bool)])
+
+    def step(self):
+        self.sync_flowers()
+        tick = self.world.clock.tick
+        hive = self.world.hive
+
+        resting = self.at_hive.copy()
+        rested = resting & (tick - self.hive_arrival_tick >= hive_rest_ticks)
+        self.at_hive[rested] = False
+        self.energy[rested] = 100
+
+        active = np.flatnonzero(~resting)
+        if active.size == 0:
+            return
+
+        self.environment.deposit_pheromones(self.x[active], self.y[active], 1.0)
+
+        all_visited = self.visited[active].sum(axis=1) == len(self.flower_list)
+        returning = active[(self.energy[active] <= 0) | all_visited]
+        foraging = active[(self.energy[active] > 0) & ~all_visited]
+
+        if returning.size:
+            self.return_to_hive(returning, hive, tick)
+        if foraging.size:
+            self.forage(foraging)
+
+    def return_to_hive(self, bees, hive, tick):
+        hive_distance = np.hypot(self.x[bees] - hive.x, self.y[bees] - hive.y)
+        flying = bees[hive_distance > 5]
+        arrived = bees[hive_distance <= 5]
+
+        if flying.size:
+            self.move_towards(flying, np.full(flying.size, float(hive.x)), np.full(flying.size, float(hive.y)))
+            self.environment.deposit_pheromones(self.x[flying], self.y[flying], 1.0)
+
+        if arrived.size:
+            self.visited[arrived] = False
+            self.route_length[arrived] = 0
+            self.x[arrived] = hive.x
+            self.y[arrived] = hive.y
+            self.at_hive[arrived] = True
+            self.hive_arrival_tick[arrived] = tick
+            for bouts in self.foraging_bouts[arrived].tolist():
+                self.totals.complete_bout(bouts)
+            self.foraging_bouts[arrived] += 1
+            hive.total_foraging_bouts += arrived.size
+
+    def forage(self, bees):
+        if self.environment.get_weather() == "rainy":
+            self.set_speeds(bees, np.maximum(1, self.speed[bees] * 0.5))
+            self.energy[bees] -= 0.15
+            self.fov_radius[bees] = 60
+            weather_input = 0
+        else:
+            self.fov_radius[bees] = 100
+            weather_input = 1
+
+        targets, has_target = self.find_nearest_flowers(bees)
+        if has_target.any():
+            distance = np.where(has_target, np.hypot(self.flower_x[targets] - self.x[bees],
+                                                     self.flower_y[targets] - self.y[bees]), 1.0)
+        else:
+            distance = np.ones(bees.size)
+
+        if self.landmark is not None:
+            landmark_distance = np.hypot(self.flower_x[self.landmark] - self.x[bees],
+                                         self.flower_y[self.landmark] - self.y[bees])
+        else:
+            landmark_distance = np.ones(bees.size)
+
+        inputs = np.column_stack([
+            distance,
+            self.energy[bees],
+            self.environment.get_pheromone_levels(self.x[bees], self.y[bees]),
+            np.full(bees.size, weather_input),
+            landmark_distance
+        ])
+        outputs = activate_batch(self.net, inputs)
+        self.direction[bees] += outputs[:, 0] * 2 * math.pi - math.pi
+        self.set_speeds(bees, np.clip(self.speed[bees] + outputs[:, 1] * 2 - 1, 1, 5))
+
+        movers = bees[has_target]
+        if movers.size == 0:
+            return
+        targets = targets[has_target]
+        self.move_towards(movers, self.flower_x[targets], self.flower_y[targets])
+
+        reached = np.hypot(self.flower_x[targets] - self.x[movers], self.flower_y[targets] - self.y[movers]) < 5
+        self.visit_flowers(movers[reached], targets[reached])
+
+    def find_nearest_flowers(self, bees):
+        if not self.flower_list:
+            return np.zeros(bees.size, dtype=int), np.zeros(bees.size, dtype=bool)
+        distances = np.hypot(self.flower_x[None, :] - self.x[bees, None],
+                             self.flower_y[None, :] - self.y[bees, None])
+        unvisited = ~self.visited[bees]
+        special_distances = np.where(unvisited & self.flower_special, distances, np.inf)
+        normal_distances = np.where(unvisited & ~self.flower_special, distances, np.inf)
+
+        has_special = np.isfinite(special_distances.min(axis=1))
+        targets = np.where(has_special, special_distances.argmin(axis=1), normal_distances.argmin(axis=1))
+        has_target = has_special | np.isfinite(normal_distances.min(axis=1))
+        return targets, has_target
+
+    def move_towards(self, bees, target_x, target_y):
+        speed = self.speed[bees]
+        direction = np.arctan2(target_y - self.y[bees], target_x - self.x[bees])
+        blocked = self.environment.is_obstacle_batch(self.x[bees] + speed * np.cos(direction),
+                                                     self.y[bees] + speed * np.sin(direction))
+        if blocked.any():
+            direction[blocked] += self.np_rng.uniform(-math.pi / 2, math.pi / 2, blocked.sum())
+
+        self.x[bees] += speed * np.cos(direction)
+        self.y[bees] += speed * np.sin(direction)
+        self.route_length[bees] += speed
+        self.energy[bees] -= 0.1
+        self.total_distance_traveled[bees] += speed
+        self.totals.distance += float(speed.sum())
+
+    def visit_flowers(self, bees, flowers):
+        if bees.size == 0:
+            return
+        nectar = self.flower_nectar[flowers]
+        self.visited[bees, flowers] = True
+        self.energy[bees] += nectar
+        self.total_nectar_collected[bees] += nectar
+        self.flowers_visited[bees] += 1
+        self.totals.nectar += float(nectar.sum())
+        self.totals.flowers_visited += bees.size
+
+        improved = self.route_length[bees] < self.best_route_length[bees]
+        improved_bees = bees[improved]
+        self.best_route_length[improved_bees] = self.route_length[improved_bees]
+        self.set_speeds(improved_bees, np.minimum(self.speed[improved_bees] * 1.1, 5))
+
+    def set_speeds(self, bees, speeds):
+        self.totals.speed += float(speeds.sum() - self.speed[bees].sum())
+        self.speed[bees] = speeds
+
+    def draw(self):
+        for i in range(len(self)):
+            color = RED if self.at_hive[i] else BEE_COLOR
+            pygame.draw.circle(screen, color, (int(self.x[i]), int(self.y[i])), 5)
+
+            if visualize_fov:
+                angles = np.linspace(self.direction[i] - math.pi / 3, self.direction[i] + math.pi / 3, 30)
+                points = [(self.x[i], self.y[i])]
+                points.extend(zip(self.x[i] + self.fov_radius[i] * np.cos(angles),
+                                  self.y[i] + self.fov_radius[i] * np.sin(angles)))
+                pygame.draw.polygon(screen, (0, 0, 255, 50), points, 1)
+
+
+# NumPy versions of neat's built-in activation and aggregation functions, keyed by function name
+NUMPY_ACTIVATIONS = {
+    'sigmoid_activation': lambda z: 1.0 / (1.0 + np.exp(-np.clip(5.0 * z, -60.0, 60.0))),
+    'tanh_activation': lambda z: np.tanh(np.clip(2.5 * z, -60.0, 60.0)),
+    'sin_activation': lambda z: np.sin(np.clip(5.0 * z, -60.0, 60.0)),
+    'gauss_activation': lambda z: np.exp(-5.0 * np.clip(z, -3.4, 3.4) ** 2),
+    'relu_activation': lambda z: np.maximum(z, 0.0),
+    'identity_activation': lambda z: z,
+    'clamped_activation': lambda z: np.clip(z, -1.0, 1.0),
+    'exp_activation': lambda z: np.exp(np.clip(z, -60.0, 60.0)),
+    'abs_activation': np.abs,
+    'hat_activation': lambda z: np.maximum(0.0, 1 - np.abs(z)),
+    'square_activation': np.square,
+    'cube_activation': lambda z: z ** 3,
+}
+
+NUMPY_AGGREGATIONS = {
+    'product_aggregation': lambda x: x.prod(axis=1),
+    'max_aggregation': lambda x: x.max(axis=1),
+    'min_aggregation': lambda x: x.min(axis=1),
+    'maxabs_aggregation': lambda x: x[np.arange(len(x)), np.abs(x).argmax(axis=1)],
+    'median_aggregation': lambda x: np.median(x, axis=1),
+    'mean_aggregation': lambda x: x.mean(axis=1),
+}
+
+
+# Feed-forward genome compiled into weight matrices, one per group of nodes that share a
+# depth, activation and aggregation, so every bee's inputs go through a single forward pass.
+# Produces the same outputs as neat.nn.FeedForwardNetwork.
+class BatchedFeedForwardNetwork:
+    def __init__(self, input_nodes, output_nodes, node_evals):
+        self.input_nodes = input_nodes
+        self.output_nodes = output_nodes
+
+        nodes = list(input_nodes) + [node for node, *_ in node_evals]
+        nodes += [node for node in output_nodes if node not in nodes]
+        self.columns = {node: i for i, node in enumerate(nodes)}
+        self.num_columns = len(nodes)
+        self.output_columns = [self.columns[node] for node in output_nodes]
+
+        depth = {node: 0 for node in input_nodes}
+        groups = {}
+        for node, act_func, agg_func, bias, response, links in node_evals:
+            depth[node] = 1 + max((depth[i] for i, w in links), default=0)
+            key = (depth[node], act_func, agg_func)
+            groups.setdefault(key, []).append((node, bias, response, links))
+
+        self.layers = []
+        for (_, act_func, agg_func), members in sorted(groups.items(), key=lambda item: item[0][0]):
+            activation = NUMPY_ACTIVATIONS.get(act_func.__name__, np.vectorize(act_func))
+            columns = np.array([self.columns[node] for node, *_ in members])
+            bias = np.array([member[1] for member in members], dtype=float)
+            response = np.array([member[2] for member in members], dtype=float)
+            if agg_func.__name__ == 'sum_aggregation':
+                weights = np.zeros((self.num_columns, len(members)))
+                for k, (node, _, _, links) in enumerate(members):
+                    for i, w in links:
+                        weights[self.columns[i], k] += w
+                self.layers.append((columns, activation, bias, response, weights, None))
+            else:
+                inputs = [([self.columns[i] for i, w in links], np.array([w for i, w in links], dtype=float))
+                          for node, _, _, links in members]
+                self.layers.append((columns, activation, bias, response, None, (agg_func, inputs)))
+
+    @staticmethod
+    def create(genome, config):
+        net = neat.nn.FeedForwardNetwork.create(genome, config)
+        return BatchedFeedForwardNetwork(net.input_nodes, net.output_nodes, net.node_evals)
+
+    def activate(self, inputs):
+        return self.activate_batch([inputs])[0].tolist()
+
+    def activate_batch(self, inputs):
+        inputs = np.asarray(inputs, dtype=float)
+        if inputs.ndim != 2 or inputs.shape[1] != len(self.input_nodes):
+            raise RuntimeError("Expected {0:n} inputs per row, got {1}".format(len(self.input_nodes), inputs.shape))
+
+        values = np.zeros((len(inputs), self.num_columns))
+        values[:, :len(self.input_nodes)] = inputs
+        for columns, activation, bias, response, weights, aggregation in self.layers:
+            if weights is not None:
+                aggregated = values @ weights
+            else:
+                agg_func, node_inputs = aggregation
+                numpy_aggregation = NUMPY_AGGREGATIONS.get(agg_func.__name__)
+                aggregated = np.empty((len(values), len(node_inputs)))
+                for k, (input_columns, input_weights) in enumerate(node_inputs):
+                    weighted = values[:, input_columns] * input_weights
+                    if numpy_aggregation is not None:
+                        aggregated[:, k] = numpy_aggregation(weighted)
+                    else:
+                        aggregated[:, k] = [agg_func(row) for row in weighted.tolist()]
+            values[:, columns] = activation(bias + response * aggregated)
+
+        return values[:, self.output_columns]
+
+
+def activate_batch(net, inputs):
+    if hasattr(net, 'activate_batch'):
+        return net.activate_batch(inputs)
+    return np.array([net.activate(row) for row in inputs])
+
+
 # Define Flower class
 class Flower:
-    def __init__(self, x=None, y=None, special=False):
-        self.x = x if x is not None else random.randint(0, width)
-        self.y = y if y is not None else random.randint(0, height)
-        self.nectar = random.randint(10, 30)
+    __slots__ = ('id', 'x', 'y', 'nectar', 'special')
+
+    def __init__(self, x=None, y=None, special=False, rng=random, nectar=None):
+        # Assigned by the World the flower joins
+        self.id = None
+        self.x = x if x is not None else rng.randint(0, width)
+        self.y = y if y is not None else rng.randint(0, height)
+        self.nectar = nectar if nectar is not None else rng.randint(10, 30)
         self.special = special
 
-    def reposition(self):
-        self.x = random.randint(0, width)
-        self.y = random.randint(0, height)
+    def reposition(self, rng=random):
+        self.x = rng.randint(0, width)
+        self.y = rng.randint(0, height)
 
-    def draw(self):
+    def draw(self, surface):
         color = SPECIAL_FLOWER_COLOR if self.special else PINK
-        pygame.draw.circle(screen, color, (self.x, self.y), 5)
+        pygame.draw.circle(surface, color, (self.x, self.y), 5)
 
 
-def create_random_array(num_flowers):
-    global flowers
-    flowers.clear()
+# Uniform grid over flower positions for nearest-unvisited and radius queries,
+# updated incrementally as flowers are added, removed or moved
+class FlowerIndex:
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.flower_cells = {}
+        self.bounds = None
+        self.flat_scan_size = 32
+
+    def __len__(self):
+        return len(self.flower_cells)
+
+    def cell_of(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def add(self, flower):
+        cell = self.cell_of(flower.x, flower.y)
+        self.cells.setdefault(cell, []).append(flower)
+        self.flower_cells[flower] = cell
+        if self.bounds is None:
+            self.bounds = [cell[0], cell[1], cell[0], cell[1]]
+        else:
+            self.bounds[0] = min(self.bounds[0], cell[0])
+            self.bounds[1] = min(self.bounds[1], cell[1])
+            self.bounds[2] = max(self.bounds[2], cell[0])
+            self.bounds[3] = max(self.bounds[3], cell[1])
+
+    def remove(self, flower):
+        cell = self.flower_cells.pop(flower, None)
+        if cell is None:
+            return
+        bucket = self.cells[cell]
+        bucket.remove(flower)
+        if not bucket:
+            del self.cells[cell]
+
+    def move(self, flower):
+        self.remove(flower)
+        self.add(flower)
+
+    def rebuild(self, flowers):
+        self.cells.clear()
+        self.flower_cells.clear()
+        self.bounds = None
+        for flower in flowers:
+            self.add(flower)
+
+    def ring_cells(self, cx, cy, ring):
+        if ring == 0:
+            yield cx, cy
+            return
+        for i in range(cx - ring, cx + ring + 1):
+            yield i, cy - ring
+            yield i, cy + ring
+        for j in range(cy - ring + 1, cy + ring):
+            yield cx - ring, j
+            yield cx + ring, j
+
+    # visited is a bitmask of flower ids to skip
+    def nearest(self, x, y, visited=0):
+        if not self.flower_cells:
+            return None
+        cx, cy = self.cell_of(x, y)
+        min_x, min_y, max_x, max_y = self.bounds
+        max_ring = max(cx - min_x, max_x - cx, cy - min_y, max_y - cy)
+
+        nearest_flower = None
+        min_distance = float('inf')
+        for ring in range(max_ring + 1):
+            # Once a ring has more cells than the index has occupied ones, a flat scan is cheaper
+            if 8 * ring > len(self.cells) or len(self.flower_cells) <= self.flat_scan_size:
+                candidates = self.flower_cells
+            else:
+                candidates = [flower for cell in self.ring_cells(cx, cy, ring)
+                              for flower in self.cells.get(cell, ())]
+            for flower in candidates:
+                if visited >> flower.id & 1:
+                    continue
+                distance = math.sqrt((x - flower.x) ** 2 + (y - flower.y) ** 2)
+                if distance < min_distance:
+                    min_distance = distance
+                    nearest_flower = flower
+            if candidates is self.flower_cells or min_distance <= ring * self.cell_size:
+                break
+        return nearest_flower
+
+    def within_radius(self, x, y, radius):
+        min_cx, min_cy = self.cell_of(x - radius, y - radius)
+        max_cx, max_cy = self.cell_of(x + radius, y + radius)
+        found = []
+        for i in range(min_cx, max_cx + 1):
+            for j in range(min_cy, max_cy + 1):
+                for flower in self.cells.get((i, j), ()):
+                    if math.sqrt((x - flower.x) ** 2 + (y - flower.y) ** 2) < radius:
+                        found.append(flower)
+        return found
+
+
+def create_random_array(num_flowers, rng):
+    flowers = []
     for _ in range(num_flowers):
-        flowers.append(Flower())
+        flowers.append(Flower(rng=rng))
     print("Created random array of flowers.")
+    return flowers
 
 
-def create_independent_array(num_flowers):
-    global flowers
-    flowers.clear()
+def create_independent_array(num_flowers, rng):
+    flowers = []
     rows = int(math.sqrt(num_flowers))
     cols = num_flowers // rows
     x_spacing = width // (cols + 1)
@@ -349,26 +1033,26 @@ def create_independent_array(num_flowers):
         for j in range(cols):
             if len(flowers) < num_flowers:
                 flowers.append(
-                    Flower(x=(j + 1) * x_spacing, y=(i + 1) * y_spacing))
+                    Flower(x=(j + 1) * x_spacing, y=(i + 1) * y_spacing, rng=rng))
     print("Created independent array of flowers.")
+    return flowers
 
 
-def create_positive_array(num_flowers):
-    global flowers
-    flowers.clear()
+def create_positive_array(num_flowers, rng):
+    flowers = []
     radius = min(width, height) // 4
     angle_increment = 2 * math.pi / num_flowers
     for i in range(num_flowers):
         angle = i * angle_increment
         x = width // 2 + int(radius * math.cos(angle))
         y = height // 2 + int(radius * math.sin(angle))
-        flowers.append(Flower(x=x, y=y))
+        flowers.append(Flower(x=x, y=y, rng=rng))
     print("Created positive array of flowers.")
+    return flowers
 
 
-def create_negative_array(num_flowers):
-    global flowers
-    flowers.clear()
+def create_negative_array(num_flowers, rng):
+    flowers = []
     if num_flowers < 10:
         num_flowers = 10
 
@@ -379,29 +1063,30 @@ def create_negative_array(num_flowers):
 
     for i in range(num_flowers):
         pos = positions[i % 10]
-        flowers.append(Flower(x=pos[0], y=pos[1]))
+        flowers.append(Flower(x=pos[0], y=pos[1], rng=rng))
 
     print("Created negative array of flowers.")
+    return flowers
 
 
 # New Arrays
 
-def create_negative_array_v2(num_flowers):
-    global flowers
-    flowers.clear()
+def create_negative_array_v2(num_flowers, rng):
+    flowers = []
     positions = [
         (100, 100), (300, 150), (200, 200),
         (400, 250), (300, 300), (500, 350),
         (400, 400), (600, 450), (500, 500), (700, 550)
     ]
     for i in range(num_flowers):
-        flowers.append(Flower(x=positions[i][0], y=positions[i][1]))
+        pos = positions[i % len(positions)]
+        flowers.append(Flower(x=pos[0], y=pos[1], rng=rng))
     print("Created negative array v2 of flowers.")
+    return flowers
 
 
-def create_independent_array_v2(num_flowers):
-    global flowers
-    flowers.clear()
+def create_independent_array_v2(num_flowers, rng):
+    flowers = []
 
     base_length = 3
 
@@ -436,199 +1121,549 @@ def create_independent_array_v2(num_flowers):
     positions.append((additional_flower_x, additional_flower_y))
 
     for i in range(num_flowers):
-        flowers.append(Flower(x=positions[i][0], y=positions[i][1]))
+        pos = positions[i % len(positions)]
+        flowers.append(Flower(x=pos[0], y=pos[1], rng=rng))
 
     print("Created equidistant inverted triangle array of flowers with an additional flower above the hive.")
+    return flowers
 
 
-def create_positive_array_v2(num_flowers):
-    global flowers
-    flowers.clear()
+def create_positive_array_v2(num_flowers, rng):
+    flowers = []
     positions = [
         (250, 100), (300, 150), (350, 200),
         (400, 250), (450, 300), (500, 350),
         (550, 400), (600, 450), (650, 500), (700, 550)
     ]
     for i in range(num_flowers):
-        flowers.append(Flower(x=positions[i][0], y=positions[i][1]))
+        pos = positions[i % len(positions)]
+        flowers.append(Flower(x=pos[0], y=pos[1], rng=rng))
     print("Created positive array v2 of flowers.")
+    return flowers
+
+
+layout_generators = {
+    'random': create_random_array,
+    'positive': create_positive_array,
+    'independent': create_independent_array,
+    'negative': create_negative_array,
+    'positive_v2': create_positive_array_v2,
+    'independent_v2': create_independent_array_v2,
+    'negative_v2': create_negative_array_v2,
+}
+
+
+# Flower positions, nectar and hive geometry of one generated layout. Layouts are immutable;
+# each episode works on its own Flower objects from clone()
+class FlowerLayout:
+    def __init__(self, flowers, special_flowers, hive_x, hive_y):
+        self.flower_data = [(flower.x, flower.y, flower.nectar) for flower in flowers]
+        self.special_flower_data = [(flower.x, flower.y, flower.nectar) for flower in special_flowers]
+
+        # Normal flowers first, the order World.find_nearest_flower_to_hive breaks ties in
+        positions = np.array([(x, y) for x, y, nectar in self.flower_data + self.special_flower_data],
+                             dtype=float).reshape(-1, 2)
+        self.hive_distances = np.sqrt((positions[:, 0] - hive_x) ** 2 + (positions[:, 1] - hive_y) ** 2)
+        self.landmark = int(np.argmin(self.hive_distances)) if len(positions) else None
+
+    @classmethod
+    def generate(cls, array_type, num_flowers, num_special_flowers, rng):
+        generator = layout_generators.get(array_type, create_random_array)
+        flowers = generator(num_flowers, rng)
+        special_flowers = [Flower(special=True, rng=rng) for _ in range(num_special_flowers)]
+        hive = Hive()
+        return cls(flowers, special_flowers, hive.x, hive.y)
+
+    def clone(self):
+        flowers = [Flower(x, y, nectar=nectar) for x, y, nectar in self.flower_data]
+        special_flowers = [Flower(x, y, special=True, nectar=nectar)
+                           for x, y, nectar in self.special_flower_data]
+        return flowers, special_flowers
+
+    def landmark_flower(self, flowers, special_flowers):
+        if self.landmark is None:
+            return None
+        if self.landmark < len(flowers):
+            return flowers[self.landmark]
+        return special_flowers[self.landmark - len(flowers)]
+
+
+# Layouts generated from a seed, kept per process so every episode on the same
+# (array_type, num_flowers, num_special_flowers, seed) reuses one FlowerLayout
+flower_layouts = {}
+
+
+def flower_layout(array_type, num_flowers, num_special_flowers, seed=None, rng=random):
+    if seed is None:
+        return FlowerLayout.generate(array_type, num_flowers, num_special_flowers, rng)
+    key = (array_type, num_flowers, num_special_flowers, seed)
+    if key not in flower_layouts:
+        flower_layouts[key] = FlowerLayout.generate(array_type, num_flowers, num_special_flowers,
+                                                    random.Random(seed))
+    return flower_layouts[key]
+
+
+# World owns all state of one simulation, so independent worlds can coexist in a process
+class World:
+    def __init__(self, seed=None, engine='object'):
+        self.rng = random.Random(seed)
+        self.engine = engine
+        self.clock = SimulationClock()
+        self.environment = Environment(width, height, 20)
+        self.hive = Hive()
+        self.flowers = []
+        self.special_flowers = []
+        self.bees = []
+        self.swarm = None
+        self.net = None
+        self.full_hive_bouts = 0
+        self.layout_version = 0
+        # Flower ids index the bees' visited bitmasks; they restart each episode and are never reused
+        self.next_flower_id = 0
+        self.flower_index = FlowerIndex(self.environment.cell_size)
+        self.special_flower_index = FlowerIndex(self.environment.cell_size)
+        # Values derived from the flower layout, dropped whenever it changes
+        self.layout_cache = QueryCache()
+        self.totals = SwarmTotals()
+
+        self.target_full_hive_bouts = 10
+        # Episodes also end once the step budget runs out or no bee made progress for stall_ticks
+        self.max_steps = 30000
+        self.stall_ticks = 1500
+        self.last_progress = 0
+        self.last_progress_tick = 0
+        self.end_reason = None
+        # Efficiencies are sampled once per full hive bout, or every metric_interval ticks if set
+        self.metric_interval = None
+        self.recorded_full_hive_bouts = 0
+        self.foraging_efficiency = MetricStream()
+        self.search_efficiency = MetricStream()
+        # One record per full hive bout of the current episode
+        self.bout_log = []
+        # (command, args) posted by other threads, run by the simulation thread before the next step
+        self.commands = deque()
+        # Weather transitions, flower deaths and spawns, and full hive bout reshuffles
+        self.events = EventScheduler()
+        self.evaporation_rate = 0.010
+        self.diffusion_rate = 0.0
+        self.weather_changes_enabled = False
+        self.rain_enabled = False
+        self.dying_flowers_enabled = False
+        self.random_spawn_flowers_enabled = False
+        self.random_spawn_despawn_enabled = False
+        self.random_obstacles_enabled = False
+        self.obstacles_enabled = False
+
+    # A layout_seed makes the flower layout reproducible and lets episodes share a cached one
+    def initialize(self, num_flowers, num_special_flowers, num_bees, array_type='random', net=None,
+                   layout_seed=None):
+        # initializing hive here
+        self.hive = Hive()
+
+        if 'v2' in array_type:
+            self.hive.y = height - 50  # Place hive at the bottom for v2 arrays
+
+        self.foraging_efficiency.clear()
+        self.search_efficiency.clear()
+        self.full_hive_bouts = 0
+        self.recorded_full_hive_bouts = 0
+        self.bout_log.clear()
+        self.last_progress = 0
+        self.last_progress_tick = 0
+        self.end_reason = None
+
+        self.environment.reset_pheromones()
+        self.clock.reset()
+
+        layout = flower_layout(array_type, num_flowers, num_special_flowers, layout_seed, self.rng)
+        flowers, special_flowers = layout.clone()
+        self.flowers[:] = flowers
+        self.special_flowers[:] = special_flowers
+        self.next_flower_id = 0
+        for flower in itertools.chain(self.flowers, self.special_flowers):
+            self.assign_flower_id(flower)
+
+        self.rebuild_flower_index()
+        landmark = layout.landmark_flower(self.flowers, self.special_flowers)
+        self.layout_cache.get('hive_landmark', lambda: landmark)
+
+        self.environment.clear_obstacles()
+        if self.obstacles_enabled:
+            create_obstacles(self)
+
+        if net is None:
+            net = self.net if self.net is not None else default_network()
+        self.net = net
 
+        self.totals.reset()
+        if self.engine == 'vectorized':
+            self.bees = []
+            self.swarm = BeeSwarm(self, num_bees, net)
+        else:
+            self.bees = [Bumblebee(self, net) for _ in range(num_bees)]
+            self.swarm = None
 
-def initialize_simulation(num_flowers, num_special_flowers, num_bees, array_type='random', net=None):
-    global flowers, special_flowers, bees, hive, foraging_efficiency, search_efficiency, obstacles_enabled
+        self.start_events()
+        print(
+            f"Initialized simulation with {num_flowers} flowers, {num_special_flowers} special flowers, and {num_bees} bees.")
 
-    # initializing hive here
-    hive = Hive()
+    # Flowers were added, removed or moved; engines and caches rebuild lazily from this
+    def layout_changed(self):
+        self.layout_version += 1
+        self.layout_cache.invalidate()
 
-    if 'v2' in array_type:
-        hive.y = height - 50  # Place hive at the bottom for v2 arrays
+    # Flower closest to the hive, used by bees as a landmark
+    def hive_landmark(self):
+        return self.layout_cache.get('hive_landmark', self.find_nearest_flower_to_hive)
 
-    foraging_efficiency.clear()
-    search_efficiency.clear()
+    def find_nearest_flower_to_hive(self):
+        min_distance = float('inf')
+        nearest_flower = None
+        for flower in itertools.chain(self.flowers, self.special_flowers):
+            distance = math.sqrt((self.hive.x - flower.x)
+                                 ** 2 + (self.hive.y - flower.y) ** 2)
+            if distance < min_distance:
+                min_distance = distance
+                nearest_flower = flower
+        return nearest_flower
 
-    environment.reset_pheromones()
+    def rebuild_flower_index(self):
+        self.flower_index.rebuild(self.flowers)
+        self.special_flower_index.rebuild(self.special_flowers)
+        self.layout_changed()
 
-    if array_type == 'positive':
-        create_positive_array(num_flowers)
-    elif array_type == 'independent':
-        create_independent_array(num_flowers)
-    elif array_type == 'negative':
-        create_negative_array(num_flowers)
-    elif array_type == 'positive_v2':
-        create_positive_array_v2(num_flowers)
-    elif array_type == 'independent_v2':
-        create_independent_array_v2(num_flowers)
-    elif array_type == 'negative_v2':
-        create_negative_array_v2(num_flowers)
-    else:
-        create_random_array(num_flowers)
+    def index_for(self, flower):
+        return self.special_flower_index if flower.special else self.flower_index
 
-    special_flowers = [Flower(special=True)
-                       for _ in range(num_special_flowers)]
+    def assign_flower_id(self, flower):
+        flower.id = self.next_flower_id
+        self.next_flower_id += 1
 
-    if obstacles_enabled:
-        create_obstacles()
+    def add_flower(self, flower):
+        self.assign_flower_id(flower)
+        if flower.special:
+            self.special_flowers.append(flower)
+        else:
+            self.flowers.append(flower)
+        self.index_for(flower).add(flower)
+        self.layout_changed()
 
-    if net is None:
-        if bees:
-            net = bees[0].net
+    def remove_flower(self, flower):
+        if flower.special:
+            self.special_flowers.remove(flower)
+        else:
+            self.flowers.remove(flower)
+        self.index_for(flower).remove(flower)
+        for bee in self.bees:
+            bee.forget_flower(flower)
+        self.layout_changed()
+
+    def reposition_flower(self, flower):
+        flower.reposition(self.rng)
+        self.index_for(flower).move(flower)
+        self.layout_changed()
+
+    def flowers_within(self, x, y, radius):
+        return (self.flower_index.within_radius(x, y, radius) +
+                self.special_flower_index.within_radius(x, y, radius))
+
+    def bee_count(self):
+        if self.swarm is not None:
+            return len(self.swarm)
+        return len(self.bees)
+
+    def calculate_full_hive_bouts(self):
+        return self.totals.min_bouts
+
+    def total_nectar_collected(self):
+        return self.totals.nectar
+
+    def total_flowers_visited(self):
+        return self.totals.flowers_visited
+
+    def total_distance_traveled(self):
+        return self.totals.distance
+
+    def average_speed(self):
+        return self.totals.speed / self.totals.bees
+
+    def average_search_efficiency(self):
+        if self.swarm is not None:
+            distance = self.swarm.total_distance_traveled
+            efficiency = np.divide(self.swarm.flowers_visited, distance,
+                                   out=np.zeros(len(distance)), where=distance > 0)
+            return float(efficiency.mean())
+        return sum(
+            bee.flowers_visited / bee.total_distance_traveled if bee.total_distance_traveled > 0 else 0 for bee in
+            self.bees) / len(self.bees)
+
+    # Safe to call from any thread: deque appends are atomic, and the world is only mutated
+    # when the simulation thread runs the command at the start of its next step
+    def post(self, command, *args):
+        self.commands.append((command, args))
+
+    def run_commands(self):
+        while self.commands:
+            command, args = self.commands.popleft()
+            command(self, *args)
+
+    # Starts the event chains for the enabled dynamics. Toggling one mid-episode goes through
+    # its update_* handler, which starts or cancels that chain
+    def start_events(self):
+        self.events.clear()
+        change_weather(self)
+        if self.dying_flowers_enabled:
+            schedule_flower_death(self)
+        if self.random_spawn_flowers_enabled:
+            schedule_flower_spawn(self)
+
+    def step(self):
+        self.run_commands()
+        self.events.run_due(self, self.clock.tick)
+
+        if self.environment.get_weather() == "rainy":
+            adjusted_evaporation_rate = min(self.evaporation_rate * 2, 0.99)
         else:
-            genome = neat.DefaultGenome(0)
-            net = neat.nn.FeedForwardNetwork.create(genome, config)
+            adjusted_evaporation_rate = self.evaporation_rate
+
+        if self.swarm is not None:
+            self.swarm.step()
+        else:
+            self.update_bees()
+
+        self.environment.update_pheromones(adjusted_evaporation_rate, self.diffusion_rate)
+        self.clock.advance()
+
+        self.full_hive_bouts = self.calculate_full_hive_bouts()
+        new_full_hive_bout = self.full_hive_bouts > self.recorded_full_hive_bouts
+        self.recorded_full_hive_bouts = max(self.recorded_full_hive_bouts, self.full_hive_bouts)
+        if new_full_hive_bout:
+            self.log_bout()
+            self.events.schedule(self.clock.tick, 'full_hive_bout', full_hive_bout_changes)
+        if self.full_hive_bouts > 0:
+            if self.metric_interval is None:
+                if new_full_hive_bout:
+                    self.record_metrics()
+            elif self.clock.tick % self.metric_interval == 0:
+                self.record_metrics()
+
+        progress = self.total_flowers_visited() + self.hive.total_foraging_bouts
+        if progress != self.last_progress:
+            self.last_progress = progress
+            self.last_progress_tick = self.clock.tick
+
+    def log_bout(self):
+        self.bout_log.append({
+            'full_hive_bout': self.full_hive_bouts,
+            'tick': self.clock.tick,
+            'nectar': self.total_nectar_collected(),
+            'flowers_visited': self.total_flowers_visited(),
+            'distance': self.total_distance_traveled(),
+            'weather': self.environment.get_weather(),
+            'flower_count': len(self.flowers) + len(self.special_flowers),
+        })
+
+    def record_metrics(self):
+        self.foraging_efficiency.append(self.total_nectar_collected() / self.full_hive_bouts)
+        self.search_efficiency.append(self.average_search_efficiency())
+
+    # Foraging bees' network inputs are batched into one activation, then their moves run in
+    # list order. A bee flying home moves during begin_update and may draw from the world RNG
+    # to steer around obstacles, so when there are obstacles the pending batch is finished
+    # first, keeping every RNG draw in the same order as updating the bees one by one
+    def update_bees(self):
+        foraging_bees = []
+        inputs = []
+        for bee in self.bees:
+            if foraging_bees and self.environment.obstacles and bee.heading_home():
+                self.finish_bees(foraging_bees, inputs)
+                foraging_bees = []
+                inputs = []
+            bee_inputs = bee.begin_update()
+            if bee_inputs is not None:
+                foraging_bees.append(bee)
+                inputs.append(bee_inputs)
+
+        if foraging_bees:
+            self.finish_bees(foraging_bees, inputs)
+
+    def finish_bees(self, bees, inputs):
+        outputs = activate_batch(self.net, inputs).tolist()
+        for bee, output in zip(bees, outputs):
+            bee.finish_update(output)
+
+    def is_finished(self):
+        if self.full_hive_bouts >= self.target_full_hive_bouts:
+            self.end_reason = f"reaching {self.full_hive_bouts} full hive bouts"
+        elif self.clock.tick >= self.max_steps:
+            self.end_reason = f"running out of its {self.max_steps} step budget"
+        elif self.bee_count() == 0 or not (self.flowers or self.special_flowers):
+            self.end_reason = "the swarm having no bees or no flowers left"
+        elif self.clock.tick - self.last_progress_tick >= self.stall_ticks:
+            self.end_reason = f"no flower visits or hive arrivals for {self.stall_ticks} steps"
+        else:
+            return False
+        return True
 
-    bees = [Bumblebee(flowers, special_flowers, hive, net)
-            for _ in range(num_bees)]
-    print(
-        f"Initialized simulation with {num_flowers} flowers, {num_special_flowers} special flowers, and {num_bees} bees.")
 
+def default_network():
+    genome = neat.DefaultGenome(0)
+    return BatchedFeedForwardNetwork.create(genome, load_config())
 
-def create_obstacles():
-    global environment
-    num_obstacles = random.randint(5, 10)
+
+def create_obstacles(world):
+    num_obstacles = world.rng.randint(5, 10)
     for _ in range(num_obstacles):
-        x = random.randint(50, width - 50)
-        y = random.randint(50, height - 50)
-        size = random.randint(20, 50)
-        environment.add_obstacle(x, y, size)
+        x = world.rng.randint(50, width - 50)
+        y = world.rng.randint(50, height - 50)
+        size = world.rng.randint(20, 50)
+        world.environment.add_obstacle(x, y, size)
     print(f"Created {num_obstacles} obstacles.")
 
 
-def create_random_obstacles():
-    global environment
-    environment.clear_obstacles()
-    num_obstacles = random.randint(5, 10)
+def create_random_obstacles(world):
+    world.environment.clear_obstacles()
+    num_obstacles = world.rng.randint(5, 10)
     for _ in range(num_obstacles):
-        x = random.randint(50, width - 50)
-        y = random.randint(50, height - 50)
-        size = random.randint(20, 50)
-        environment.add_obstacle(x, y, size)
+        x = world.rng.randint(50, width - 50)
+        y = world.rng.randint(50, height - 50)
+        size = world.rng.randint(20, 50)
+        world.environment.add_obstacle(x, y, size)
     print(f"Created {num_obstacles} random obstacles after full hive bout.")
 
 
-def add_special_flower():
-    global special_flowers
-    special_flowers.append(Flower(special=True))
+def add_special_flower(world):
+    world.add_flower(Flower(special=True, rng=world.rng))
     print(
-        f"Added a special flower. Total special flowers: {len(special_flowers)}")
+        f"Added a special flower. Total special flowers: {len(world.special_flowers)}")
 
 
-def add_normal_flower():
-    global flowers
-    flowers.append(Flower())
-    print(f"Added a normal flower. Total flowers: {len(flowers)}")
+def add_normal_flower(world):
+    world.add_flower(Flower(rng=world.rng))
+    print(f"Added a normal flower. Total flowers: {len(world.flowers)}")
 
 
-def randomly_spawn_flower():
-    global flowers
-    flowers.append(Flower())
-    print(f"Randomly spawned a flower. Total flowers: {len(flowers)}")
+def randomly_spawn_flower(world):
+    world.add_flower(Flower(rng=world.rng))
+    print(f"Randomly spawned a flower. Total flowers: {len(world.flowers)}")
 
 
-def reposition_flowers():
-    global flowers, special_flowers
-    for flower in flowers + special_flowers:
-        flower.reposition()
+def reposition_flowers(world):
+    for flower in itertools.chain(world.flowers, world.special_flowers):
+        world.reposition_flower(flower)
     print("Repositioned all flowers.")
 
 
-def delete_flower_at_position(pos):
-    global flowers, special_flowers
+def delete_flower_at_position(world, pos):
     x, y = pos
-    for flower_list in (flowers, special_flowers):
-        for flower in flower_list[:]:
-            if math.sqrt((flower.x - x) ** 2 + (flower.y - y) ** 2) < 5:
-                flower_list.remove(flower)
+    for flower in world.flowers_within(x, y, 5):
+        world.remove_flower(flower)
     print("Deleted flower at position:", pos)
 
 
-def add_bee():
-    global hive
-    if bees:
-        net = bees[0].net
+def add_bee(world):
+    if world.swarm is not None:
+        world.swarm.add_bee(world.hive.x, world.hive.y)
+        print(f"Bee added. Total bees: {world.bee_count()}")
+        return
+
+    if world.bees:
+        net = world.bees[0].net
     else:
-        genome = neat.DefaultGenome(0)
-        net = neat.nn.FeedForwardNetwork.create(genome, config)
+        net = world.net if world.net is not None else default_network()
 
-    new_bee = Bumblebee(flowers, special_flowers, hive, net)
-    new_bee.x, new_bee.y = hive.x, hive.y
-    bees.append(new_bee)
+    new_bee = Bumblebee(world, net)
+    new_bee.x, new_bee.y = world.hive.x, world.hive.y
+    world.bees.append(new_bee)
 
-    print(f"Bee added. Total bees: {len(bees)}")
+    print(f"Bee added. Total bees: {len(world.bees)}")
 
 
-def increase_speed():
-    global bees
-    for bee in bees:
-        bee.speed = min(bee.speed + 1.0, 10)
+def increase_speed(world):
+    if world.swarm is not None:
+        swarm = world.swarm
+        swarm.set_speeds(np.arange(len(swarm)), np.minimum(swarm.speed + 1.0, 10))
+    for bee in world.bees:
+        bee.set_speed(min(bee.speed + 1.0, 10))
     print("Increased speed of all bees.")
 
 
-def decrease_speed():
-    global bees
-    for bee in bees:
-        bee.speed = max(bee.speed - 1.0, 0.5)
+def decrease_speed(world):
+    if world.swarm is not None:
+        swarm = world.swarm
+        swarm.set_speeds(np.arange(len(swarm)), np.maximum(swarm.speed - 1.0, 0.5))
+    for bee in world.bees:
+        bee.set_speed(max(bee.speed - 1.0, 0.5))
     print("Decreased speed of all bees.")
 
 
-def randomly_kill_flower():
-    global flowers
-    if flowers:
-        flower_to_kill = random.choice(flowers)
-        flowers.remove(flower_to_kill)
+def randomly_kill_flower(world):
+    if world.flowers:
+        flower_to_kill = world.rng.choice(world.flowers)
+        world.remove_flower(flower_to_kill)
         print("A flower has died.")
 
 
-def start_dying_flowers():
-    global dying_flowers_enabled
-    while dying_flowers_enabled:
-        randomly_kill_flower()
-        time.sleep(random.uniform(1, 3))
+# Scheduled events. Each takes the world and, if it recurs, schedules its next occurrence
+
+# Sets the weather for the current tick and schedules the next clear/rainy transition
+def change_weather(world):
+    tick = world.clock.tick
+    world.environment.update_weather(tick, world.weather_changes_enabled, world.rain_enabled)
+    if world.weather_changes_enabled and not world.rain_enabled:
+        phase = tick % weather_period_ticks
+        half_period = weather_period_ticks // 2
+        next_change = tick - phase + (half_period if phase < half_period else weather_period_ticks)
+        world.events.schedule(next_change, 'weather', change_weather)
+    else:
+        world.events.cancel('weather')
+
+
+def flower_death(world):
+    randomly_kill_flower(world)
+    schedule_flower_death(world)
+
+
+def schedule_flower_death(world):
+    delay = world.rng.randint(*flower_death_interval_ticks)
+    world.events.schedule(world.clock.tick + delay, 'flower_death', flower_death)
+
+
+def flower_spawn(world):
+    randomly_spawn_flower(world)
+    schedule_flower_spawn(world)
+
 
+def schedule_flower_spawn(world):
+    delay = world.rng.randint(*flower_spawn_interval_ticks)
+    world.events.schedule(world.clock.tick + delay, 'flower_spawn', flower_spawn)
 
-def start_random_spawning_flowers():
-    global random_spawn_flowers_enabled
-    while random_spawn_flowers_enabled:
-        randomly_spawn_flower()
-        time.sleep(random.uniform(2, 5))
 
+# Runs at the start of the step after a full hive bout completes
+def full_hive_bout_changes(world):
+    if world.random_obstacles_enabled:
+        create_random_obstacles(world)
+    random_spawn_despawn_flowers(world)
+    world.hive.full_hive_bouts = world.full_hive_bouts
 
-def random_spawn_despawn_flowers():
-    global flowers, random_spawn_despawn_enabled
-    if random_spawn_despawn_enabled:
-        num_to_change = max(1, int(len(flowers) * 0.1))
+
+def random_spawn_despawn_flowers(world):
+    if world.random_spawn_despawn_enabled:
+        num_to_change = max(1, int(len(world.flowers) * 0.1))
 
         for _ in range(num_to_change):
-            if flowers:
-                flower_to_remove = random.choice(flowers)
-                flowers.remove(flower_to_remove)
+            if world.flowers:
+                flower_to_remove = world.rng.choice(world.flowers)
+                world.remove_flower(flower_to_remove)
                 print("A flower has been removed due to random spawn/despawn.")
 
         for _ in range(num_to_change):
-            flowers.append(Flower())
+            world.add_flower(Flower(rng=world.rng))
             print("A new flower has been spawned due to random spawn/despawn.")
 
 
 def show_help():
+    import tkinter as tk
     help_window = tk.Toplevel()
     help_window.title("Help")
     help_text = tk.Text(help_window, wrap='word', width=60, height=20)
@@ -640,6 +1675,7 @@ def show_help():
     3.Rest of the options can be enabled mid simulation
     4.The Simulation may crash sometime as it still has some bugs. Try to restart in your IDE (source code)
     5.Sometime bees conserve energy initially by moving slower which leads to them learning to move slow. If their behavior doesnt change restart the simulation, by executing the source again.
+    6.In the simulation window, Up/Down change the pheromone evaporation rate and Right/Left speed the simulation up or slow it down
     """
     help_text.insert(tk.END, instructions)
     help_text.config(state='disabled')
@@ -647,7 +1683,10 @@ def show_help():
     tk.Button(help_window, text="Close", command=help_window.destroy).pack()
 
 
-def configure_simulation():
+def configure_simulation(world):
+    import tkinter as tk
+    from tkinter import messagebox
+    # The panel runs on its own thread, so its world changes are posted to the simulation thread
     root = tk.Tk()
     root.title("Bumblebee Foraging Simulation Configuration")
 
@@ -673,31 +1712,31 @@ def configure_simulation():
 
     weather_toggle = tk.BooleanVar(value=False)
     tk.Checkbutton(root, text="Enable Weather Changes",
-                   variable=weather_toggle, command=update_weather_changes).pack()
+                   variable=weather_toggle, command=lambda: world.post(update_weather_changes)).pack()
 
     rain_toggle = tk.BooleanVar(value=False)
     tk.Checkbutton(root, text="Enable Rain",
-                   variable=rain_toggle, command=update_rain).pack()
+                   variable=rain_toggle, command=lambda: world.post(update_rain)).pack()
 
     dying_flowers_toggle = tk.BooleanVar(value=False)
     tk.Checkbutton(root, text="Dying Flowers",
-                   variable=dying_flowers_toggle, command=update_dying_flowers).pack()
+                   variable=dying_flowers_toggle, command=lambda: world.post(update_dying_flowers)).pack()
 
     random_spawn_flowers_toggle = tk.BooleanVar(value=False)
     tk.Checkbutton(root, text="Flower Spawning", variable=random_spawn_flowers_toggle,
-                   command=update_random_spawn).pack()
+                   command=lambda: world.post(update_random_spawn)).pack()
 
     random_spawn_despawn_toggle = tk.BooleanVar(value=False)
     tk.Checkbutton(root, text="Spawn/Despawn Flowers FHB",
-                   variable=random_spawn_despawn_toggle, command=update_random_spawn_despawn).pack()
+                   variable=random_spawn_despawn_toggle, command=lambda: world.post(update_random_spawn_despawn)).pack()
 
     obstacles_toggle = tk.BooleanVar(value=False)
     tk.Checkbutton(root, text="Obstacles",
-                   variable=obstacles_toggle, command=update_obstacles).pack()
+                   variable=obstacles_toggle, command=lambda: world.post(update_obstacles)).pack()
 
     random_obstacles_toggle = tk.BooleanVar(value=False)
     tk.Checkbutton(root, text="Random Obstacles FHB", variable=random_obstacles_toggle,
-                   command=update_random_obstacles).pack()
+                   command=lambda: world.post(update_random_obstacles)).pack()
 
     fov_toggle = tk.BooleanVar(value=False)
     tk.Checkbutton(root, text="Visualize Bees' Fields of View", variable=fov_toggle,
@@ -730,83 +1769,70 @@ def configure_simulation():
             num_flowers = int(entry_flowers.get())
             num_special_flowers = int(entry_special_flowers.get())
             num_bees = int(entry_bees.get())
-            global target_full_hive_bouts, weather_changes_enabled, rain_enabled, dying_flowers_enabled, random_spawn_flowers_enabled, random_spawn_despawn_enabled, obstacles_enabled, random_obstacles_enabled, visualize_fov, visualize_pheromones
             target_full_hive_bouts = int(entry_full_hive_bouts.get())
-            initialize_simulation(
-                num_flowers, num_special_flowers, num_bees, array_type.get())
-
-            if dying_flowers_enabled:
-                dying_flowers_thread = threading.Thread(
-                    target=start_dying_flowers)
-                dying_flowers_thread.daemon = True
-                dying_flowers_thread.start()
-
-            if random_spawn_flowers_enabled:
-                random_spawn_flowers_thread = threading.Thread(
-                    target=start_random_spawning_flowers)
-                random_spawn_flowers_thread.daemon = True
-                random_spawn_flowers_thread.start()
-
+            selected_array_type = array_type.get()
         except ValueError:
             messagebox.showerror(
                 "Error", "Please enter valid integer values for all fields.")
+            return
+
+        def restart(world):
+            world.target_full_hive_bouts = target_full_hive_bouts
+            world.initialize(
+                num_flowers, num_special_flowers, num_bees, selected_array_type)
+
+        world.post(restart)
 
     tk.Button(root, text="Start Simulation", command=start_simulation).pack()
     tk.Button(root, text="Add Special Flower",
-              command=add_special_flower).pack()
-    tk.Button(root, text="Add Normal Flower", command=add_normal_flower).pack()
-    tk.Button(root, text="Add Bee", command=add_bee).pack()
-    tk.Button(root, text="Increase Speed", command=increase_speed).pack()
-    tk.Button(root, text="Decrease Speed", command=decrease_speed).pack()
+              command=lambda: world.post(add_special_flower)).pack()
+    tk.Button(root, text="Add Normal Flower", command=lambda: world.post(add_normal_flower)).pack()
+    tk.Button(root, text="Add Bee", command=lambda: world.post(add_bee)).pack()
+    tk.Button(root, text="Increase Speed", command=lambda: world.post(increase_speed)).pack()
+    tk.Button(root, text="Decrease Speed", command=lambda: world.post(decrease_speed)).pack()
     tk.Button(root, text="Reposition Flowers",
-              command=reposition_flowers).pack()
+              command=lambda: world.post(reposition_flowers)).pack()
 
     root.mainloop()
 
 
 # Event handlers for Tkinter toggles
-def update_weather_changes():
-    global weather_changes_enabled
-    weather_changes_enabled = not weather_changes_enabled
+def update_weather_changes(world):
+    world.weather_changes_enabled = not world.weather_changes_enabled
+    change_weather(world)
 
 
-def update_rain():
-    global rain_enabled
-    rain_enabled = not rain_enabled
+def update_rain(world):
+    world.rain_enabled = not world.rain_enabled
+    change_weather(world)
 
 
-def update_dying_flowers():
-    global dying_flowers_enabled
-    dying_flowers_enabled = not dying_flowers_enabled
-    if dying_flowers_enabled:
-        dying_flowers_thread = threading.Thread(target=start_dying_flowers)
-        dying_flowers_thread.daemon = True
-        dying_flowers_thread.start()
+def update_dying_flowers(world):
+    world.dying_flowers_enabled = not world.dying_flowers_enabled
+    if world.dying_flowers_enabled:
+        schedule_flower_death(world)
+    else:
+        world.events.cancel('flower_death')
 
 
-def update_random_spawn():
-    global random_spawn_flowers_enabled
-    random_spawn_flowers_enabled = not random_spawn_flowers_enabled
-    if random_spawn_flowers_enabled:
-        random_spawn_flowers_thread = threading.Thread(
-            target=start_random_spawning_flowers)
-        random_spawn_flowers_thread.daemon = True
-        random_spawn_flowers_thread.start()
+def update_random_spawn(world):
+    world.random_spawn_flowers_enabled = not world.random_spawn_flowers_enabled
+    if world.random_spawn_flowers_enabled:
+        schedule_flower_spawn(world)
+    else:
+        world.events.cancel('flower_spawn')
 
 
-def update_random_spawn_despawn():
-    global random_spawn_despawn_enabled
-    random_spawn_despawn_enabled = not random_spawn_despawn_enabled
+def update_random_spawn_despawn(world):
+    world.random_spawn_despawn_enabled = not world.random_spawn_despawn_enabled
 
 
-def update_obstacles():
-    global obstacles_enabled
-    obstacles_enabled = not obstacles_enabled
+def update_obstacles(world):
+    world.obstacles_enabled = not world.obstacles_enabled
 
 
-def update_random_obstacles():
-    global random_obstacles_enabled
-    random_obstacles_enabled = not random_obstacles_enabled
+def update_random_obstacles(world):
+    world.random_obstacles_enabled = not world.random_obstacles_enabled
 
 
 def update_visualize_fov():
@@ -819,155 +1845,482 @@ def update_visualize_pheromones():
     visualize_pheromones = not visualize_pheromones
 
 
-tk_thread = threading.Thread(target=configure_simulation)
-tk_thread.daemon = True
-tk_thread.start()
-
 # NEAT evaluation function
 generation = 0
 fitness_history = []
 
+# World rendered and edited by the interactive Tk panel
+world = None
 
-def eval_genomes(genomes, config):
-    global generation
-    generation += 1
-    print(f"Generation: {generation}")
+# Options for the World built for each genome episode
+world_settings = {
+    'engine': 'object',
+}
 
-    for genome_id, genome in genomes:
-        net = neat.nn.FeedForwardNetwork.create(genome, config)
-        initialize_simulation(15, 0, 10, net=net)
-        fitness = run_simulation()
-        genome.fitness = fitness
-        print(f"Genome {genome_id} fitness: {genome.fitness}")
+# World attributes (environment toggles, episode limits) applied to every episode's World
+environment_settings = {}
 
-    fitness_history.append(
-        max([genome.fitness for genome_id, genome in genomes]))
+# Arguments passed to World.initialize for every genome episode
+episode_settings = {
+    'num_flowers': 15,
+    'num_special_flowers': 0,
+    'num_bees': 10,
+}
+num_workers = 1
 
+# Streams generation, genome and bout records to disk when --log-dir is given
+run_log = None
 
-def run_simulation():
-    global running, evaporation_rate
-    running = True
-    clock = pygame.time.Clock()
 
-    def calculate_full_hive_bouts(bees):
-        min_bouts = min(bee.foraging_bouts for bee in bees)
-        return min_bouts
+# One search efficiency unit is one flower visited per 100 pixels flown
+search_efficiency_scale = 100
 
-    print("Simulation started.")
-    start_time = time.time()
 
-    while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                pos = event.pos
-                delete_flower_at_position(pos)
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_UP:
-                    evaporation_rate = min(evaporation_rate + 0.01, 1.0)
-                    print(
-                        f"Evaporation rate increased to {evaporation_rate:.2f}")
-                elif event.key == pygame.K_DOWN:
-                    evaporation_rate = max(evaporation_rate - 0.01, 0.0)
-                    print(
-                        f"Evaporation rate decreased to {evaporation_rate:.2f}")
-
-        screen.fill(WHITE)
-
-        environment.update_weather()
-
-        if environment.get_weather() == "rainy":
-            adjusted_evaporation_rate = min(evaporation_rate * 2, 0.99)
-        else:
-            adjusted_evaporation_rate = evaporation_rate
+# Mean of three scores in [0, 1], so only a perfect swarm reaches the config's fitness_threshold:
+# full hive bouts completed out of the target, nectar per full hive bout and bee as a share of
+# all nectar on offer, and flowers visited per distance flown
+def calculate_fitness(world):
+    bee_count = world.bee_count()
+    if bee_count == 0:
+        return 0.0
+
+    bout_score = min(world.full_hive_bouts / world.target_full_hive_bouts, 1.0)
+
+    available_nectar = sum(flower.nectar for flower in itertools.chain(world.flowers, world.special_flowers))
+    if available_nectar > 0:
+        nectar_per_bout = world.total_nectar_collected() / max(1, world.full_hive_bouts) / bee_count
+        nectar_score = min(nectar_per_bout / available_nectar, 1.0)
+    else:
+        nectar_score = 0.0
+
+    search_score = min(world.average_search_efficiency() * search_efficiency_scale, 1.0)
+
+    return (bout_score + nectar_score + search_score) / 3
+
 
-        hive.draw()
+def episode_summary(world, fitness):
+    return {
+        'fitness': fitness,
+        'steps': world.clock.tick,
+        'full_hive_bouts': world.full_hive_bouts,
+        'foraging_bouts': world.hive.total_foraging_bouts,
+        'nectar': world.total_nectar_collected(),
+        'flowers_visited': world.total_flowers_visited(),
+        'distance': world.total_distance_traveled(),
+        'weather': world.environment.get_weather(),
+        'flower_count': len(world.flowers) + len(world.special_flowers),
+        'end_reason': world.end_reason,
+    }
 
-        environment.draw_obstacles()
-        environment.draw_pheromones()
 
-        for flower in flowers + special_flowers:
-            flower.draw()
+def create_world():
+    world = World(**world_settings)
+    for name, value in environment_settings.items():
+        setattr(world, name, value)
+    return world
 
-        for bee in bees:
-            bee.update()
+
+# Every genome is scored on each (seed, array_type) scenario. A seed of None keeps the
+# world's RNG running, so the layout differs between episodes
+scenarios = [(None, 'random')]
+
+# How per-scenario fitnesses combine into a genome's fitness: 'mean', 'min' or 'quantile'
+fitness_aggregation = 'mean'
+fitness_quantile = 0.25
+
+# Worlds kept per scenario and reused across genomes, one set per process
+scenario_worlds = {}
+
+
+def scenario_world(scenario):
+    if scenario not in scenario_worlds:
+        scenario_worlds[scenario] = create_world()
+    return scenario_worlds[scenario]
+
+
+def aggregate_fitness(fitnesses):
+    if fitness_aggregation == 'min':
+        return min(fitnesses)
+    if fitness_aggregation == 'quantile':
+        return float(np.quantile(fitnesses, fitness_quantile))
+    return sum(fitnesses) / len(fitnesses)
+
+
+# Runs one genome's episode and returns its fitness, summary and per-bout records
+def run_episode(genome, config, world=None, scenario=None, render=True):
+    seed, array_type = scenario if scenario is not None else scenarios[0]
+    if world is None:
+        world = scenario_world((seed, array_type))
+    if seed is not None:
+        world.rng.seed(seed)
+
+    net = BatchedFeedForwardNetwork.create(genome, config)
+    world.initialize(net=net, layout_seed=seed, **dict(episode_settings, array_type=array_type))
+    fitness = run_simulation(world, render)
+    summary = dict(episode_summary(world, fitness), seed=seed, array_type=array_type)
+    return fitness, summary, list(world.bout_log)
+
+
+# Sets the genome's fitness from the results of its episodes, one per scenario
+def record_genome(genome_id, genome, results):
+    genome.fitness = aggregate_fitness([fitness for fitness, summary, bout_log in results])
+    print(f"Genome {genome_id} fitness: {genome.fitness}")
+
+    if run_log is not None:
+        for episode, (fitness, summary, bout_log) in enumerate(results):
+            run_log.write('genomes', dict(generation=generation, genome_id=genome_id, episode=episode,
+                                          genome_fitness=genome.fitness, **summary))
+            for bout in bout_log:
+                run_log.write('bouts', dict(generation=generation, genome_id=genome_id,
+                                            episode=episode, **bout))
+
+
+def record_generation(genomes, start_time):
+    fitnesses = [genome.fitness for genome_id, genome in genomes]
+    fitness_history.append(max(fitnesses))
+
+    if run_log is not None:
+        run_log.write('generations', {
+            'generation': generation,
+            'genomes': len(fitnesses),
+            'best_fitness': max(fitnesses),
+            'mean_fitness': sum(fitnesses) / len(fitnesses),
+            'min_fitness': min(fitnesses),
+            'duration': time.time() - start_time,
+        })
+        run_log.flush()
+
+
+def eval_genomes(genomes, config):
+    global generation
+    generation += 1
+    print(f"Generation: {generation}")
+    start_time = time.time()
+
+    render_generation = (generation - 1) % render_generation_interval == 0
+    for i, (genome_id, genome) in enumerate(genomes):
+        render = render_generation and i % render_genome_interval == 0
+        results = [run_episode(genome, config, world, scenario, render) for scenario in scenarios]
+        record_genome(genome_id, genome, results)
+
+    record_generation(genomes, start_time)
+
+
+def init_worker(settings):
+    # Worker processes keep one World per scenario, reused across episodes, and never render
+    global headless
+    headless = True
+    random.seed()
+    # Passed explicitly because spawned workers re-import this module with default settings
+    for name, values in settings.items():
+        globals()[name].update(values)
+
+
+# Evaluates the genomes of a generation across a process pool. Every (genome, scenario)
+# episode is its own job, so a generation spreads over the workers even for small populations
+class ParallelGenomeEvaluator:
+    def __init__(self, num_workers, timeout=None):
+        self.num_workers = num_workers
+        self.timeout = timeout
+        settings = {
+            'world_settings': world_settings,
+            'environment_settings': environment_settings,
+            'episode_settings': episode_settings,
+        }
+        self.pool = multiprocessing.Pool(num_workers, initializer=init_worker, initargs=(settings,))
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def evaluate(self, genomes, config):
+        global generation
+        generation += 1
+        print(f"Generation: {generation}")
+        start_time = time.time()
+
+        jobs = [[self.pool.apply_async(run_episode, (genome, config, None, scenario))
+                 for scenario in scenarios]
+                for genome_id, genome in genomes]
+
+        for genome_jobs, (genome_id, genome) in zip(jobs, genomes):
+            record_genome(genome_id, genome, [job.get(timeout=self.timeout) for job in genome_jobs])
+
+        record_generation(genomes, start_time)
+
+
+# Appends records to one CSV file per stream (generations, genomes, bouts) in log_dir.
+# Rows are buffered and written in bulk, and every flush is synced to disk, so long runs
+# keep nothing but the buffers in memory and a crash loses at most the unflushed rows
+class RunLogWriter:
+    def __init__(self, log_dir, buffer_size=256):
+        self.log_dir = log_dir
+        self.buffer_size = buffer_size
+        self.buffers = {}
+        os.makedirs(log_dir, exist_ok=True)
+
+    def path(self, stream):
+        return os.path.join(self.log_dir, f"{stream}.csv")
+
+    def write(self, stream, record):
+        buffer = self.buffers.setdefault(stream, [])
+        buffer.append(record)
+        if len(buffer) >= self.buffer_size:
+            self.flush_stream(stream)
+
+    def flush_stream(self, stream):
+        rows = self.buffers.get(stream)
+        if not rows:
+            return
+        path = self.path(stream)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        with open(path, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]), extrasaction='ignore')
+            if new_file:
+                writer.writeheader()
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+        rows.clear()
+
+    def flush(self):
+        for stream in self.buffers:
+            self.flush_stream(stream)
+
+    def close(self):
+        self.flush()
+
+
+# neat's Checkpointer extended with this script's generation counter, fitness history,
+# best genome, genome key counter and RNG states. Checkpoints are named after the next generation to evaluate
+# and written to a temporary file first, so a preempted save never leaves a torn checkpoint
+class EvolutionCheckpointer(neat.Checkpointer):
+    def __init__(self, checkpoint_dir, reproduction, generation_interval=1, time_interval_seconds=300):
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        super().__init__(generation_interval, time_interval_seconds,
+                         os.path.join(checkpoint_dir, "neat-checkpoint-"))
+        # Saved so a resumed run keeps issuing genome keys where this one stopped
+        self.reproduction = reproduction
+        self.best_genome = None
+
+    def post_evaluate(self, config, population, species, best_genome):
+        # Copied because elite genomes are carried over and re-scored in later generations
+        if self.best_genome is None or best_genome.fitness > self.best_genome.fitness:
+            self.best_genome = copy.deepcopy(best_genome)
+
+    def save_checkpoint(self, config, population, species_set, ignored_generation):
+        filename = f"{self.filename_prefix}{generation}"
+        print(f"Saving checkpoint to {filename}")
+
+        # Reading the key counter consumes a key, so the counter is restarted at the same key
+        next_genome_key = next(self.reproduction.genome_indexer)
+        self.reproduction.genome_indexer = itertools.count(next_genome_key)
+
+        data = {
+            'generation': generation,
+            'config': config,
+            'population': population,
+            'species_set': species_set,
+            'best_genome': self.best_genome,
+            'next_genome_key': next_genome_key,
+            'fitness_history': fitness_history,
+            'random_state': random.getstate(),
+            'numpy_random_state': np.random.get_state(),
+        }
+        with gzip.open(filename + ".tmp", 'wb', compresslevel=5) as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(filename + ".tmp", filename)
+
+
+def latest_checkpoint(checkpoint_dir):
+    prefix = "neat-checkpoint-"
+    generations = [int(name[len(prefix):]) for name in os.listdir(checkpoint_dir)
+                   if name.startswith(prefix) and name[len(prefix):].isdigit()]
+    if not generations:
+        return None
+    return os.path.join(checkpoint_dir, f"{prefix}{max(generations)}")
+
+
+def restore_evolution(filename):
+    global generation, fitness_history
+    with gzip.open(filename) as f:
+        data = pickle.load(f)
+
+    random.setstate(data['random_state'])
+    np.random.set_state(data['numpy_random_state'])
+    generation = data['generation']
+    fitness_history = data['fitness_history']
+
+    population = neat.Population(data['config'], (data['population'], data['species_set'], data['generation']))
+    population.best_genome = data['best_genome']
+    population.reproduction.genome_indexer = itertools.count(data['next_genome_key'])
+    print(f"Resumed evolution from {filename} at generation {generation}.")
+    return population
+
+
+# Reads a genome saved with save_genome, or the best genome of a checkpoint
+def load_genome(filename):
+    with open(filename, 'rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b'
+    with (gzip.open if compressed else open)(filename, 'rb') as f:
+        data = pickle.load(f)
+    if isinstance(data, dict):
+        return data['best_genome']
+    return data
+
+
+def save_genome(genome, filename):
+    with open(filename + ".tmp", 'wb') as f:
+        pickle.dump(genome, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(filename + ".tmp", filename)
+
+
+def handle_events(world):
+    global running
+    for event in pygame.event.get():
+        if event.type == pygame.QUIT:
+            running = False
+        elif event.type == pygame.MOUSEBUTTONDOWN:
+            pos = event.pos
+            delete_flower_at_position(world, pos)
+        elif event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_UP:
+                world.evaporation_rate = min(world.evaporation_rate + 0.01, 1.0)
+                print(
+                    f"Evaporation rate increased to {world.evaporation_rate:.2f}")
+            elif event.key == pygame.K_DOWN:
+                world.evaporation_rate = max(world.evaporation_rate - 0.01, 0.0)
+                print(
+                    f"Evaporation rate decreased to {world.evaporation_rate:.2f}")
+            elif event.key == pygame.K_RIGHT:
+                change_steps_per_frame(2)
+            elif event.key == pygame.K_LEFT:
+                change_steps_per_frame(0.5)
+
+
+def change_steps_per_frame(factor):
+    global steps_per_frame
+    steps_per_frame = max(1, min(int(steps_per_frame * factor), max_steps_per_frame))
+    print(f"Fast-forward: {steps_per_frame} steps per frame")
+
+
+# Draws the scene in layers. The background, hive and obstacles, and the flowers above the
+# pheromone overlay, are kept in cached surfaces that are redrawn only when the layout or the
+# obstacles change. HUD lines are re-rendered only when their text changes
+class SceneRenderer:
+    def __init__(self):
+        self.font = pygame.font.Font(None, 26)
+        self.scenery = pygame.Surface((width, height))
+        self.flower_layer = pygame.Surface((width, height))
+        self.flower_layer.set_colorkey(PHEROMONE_COLORKEY)
+        self.scenery_state = None
+        self.hud_lines = []
+
+    def draw(self, world):
+        state = (world.hive, world.layout_version, world.environment.obstacle_version)
+        if state != self.scenery_state:
+            self.draw_scenery(world)
+            self.scenery_state = state
+
+        screen.blit(self.scenery, (0, 0))
+        world.environment.draw_pheromones()
+        screen.blit(self.flower_layer, (0, 0))
+
+        if world.swarm is not None:
+            world.swarm.draw()
+        for bee in world.bees:
             bee.draw()
 
-        environment.evaporate_pheromones(adjusted_evaporation_rate)
+        self.draw_hud(world)
+        pygame.display.flip()
+
+    def draw_scenery(self, world):
+        self.scenery.fill(WHITE)
+        world.hive.draw(self.scenery)
+        world.environment.draw_obstacles(self.scenery)
+
+        self.flower_layer.fill(PHEROMONE_COLORKEY)
+        for flower in itertools.chain(world.flowers, world.special_flowers):
+            flower.draw(self.flower_layer)
+
+    def draw_hud(self, world):
+        if world.bee_count():
+            speed_text = f"Average Speed: {world.average_speed():.2f}"
+        else:
+            speed_text = "Average Speed: N/A"
+        lines = [
+            f"Individual Foraging Bouts: {world.hive.total_foraging_bouts}",
+            f"Full Hive Bouts: {world.full_hive_bouts}",
+            f"Bee Count: {world.bee_count()}",
+            f"Flower Count: {len(world.flowers) + len(world.special_flowers)}",
+            speed_text,
+            f"Weather: {world.environment.get_weather().capitalize()}",
+        ]
 
-        font = pygame.font.Font(None, 26)
         text_y_position = 10
         y_offset = 20
+        for i, line in enumerate(lines):
+            if i == len(self.hud_lines):
+                self.hud_lines.append((None, None))
+            text, rendered = self.hud_lines[i]
+            if line != text:
+                rendered = self.font.render(line, True, BLACK)
+                self.hud_lines[i] = (line, rendered)
+            screen.blit(rendered, (10, text_y_position))
+            text_y_position += y_offset
 
-        total_foraging_bouts = hive.total_foraging_bouts
-        text = font.render(
-            f"Individual Foraging Bouts: {total_foraging_bouts}", True, BLACK)
-        screen.blit(text, (10, text_y_position))
-
-        text_y_position += y_offset
-        full_hive_bouts = calculate_full_hive_bouts(bees)
-        text = font.render(f"Full Hive Bouts: {full_hive_bouts}", True, BLACK)
-        screen.blit(text, (10, text_y_position))
-
-        text_y_position += y_offset
-        text = font.render(f"Bee Count: {len(bees)}", True, BLACK)
-        screen.blit(text, (10, text_y_position))
-
-        text_y_position += y_offset
-        flower_count = len(flowers) + len(special_flowers)
-        text = font.render(f"Flower Count: {flower_count}", True, BLACK)
-        screen.blit(text, (10, text_y_position))
-
-        text_y_position += y_offset
-        if bees:
-            avg_speed = sum(bee.speed for bee in bees) / len(bees)
-            speed_text = font.render(
-                f"Average Speed: {avg_speed:.2f}", True, BLACK)
-        else:
-            speed_text = font.render("Average Speed: N/A", True, BLACK)
-        screen.blit(speed_text, (10, text_y_position))
 
-        text_y_position += y_offset
-        weather_status = environment.get_weather()
-        weather_text = font.render(
-            f"Weather: {weather_status.capitalize()}", True, BLACK)
-        screen.blit(weather_text, (10, text_y_position))
+def draw_simulation(world):
+    renderer.draw(world)
 
-        pygame.display.flip()
-        clock.tick(30)
-
-        if full_hive_bouts > 0:
-            nectar_collected = sum(
-                bee.total_nectar_collected for bee in bees) / full_hive_bouts
-            foraging_efficiency.append(nectar_collected)
-            avg_search_efficiency = sum(
-                bee.flowers_visited / bee.total_distance_traveled if bee.total_distance_traveled > 0 else 0 for bee in
-                bees) / len(bees)
-            search_efficiency.append(avg_search_efficiency)
-
-            if random_obstacles_enabled and full_hive_bouts > hive.full_hive_bouts:
-                create_random_obstacles()
-                hive.full_hive_bouts = full_hive_bouts
-
-        if full_hive_bouts >= target_full_hive_bouts:
-            print(
-                f"Simulation ended after reaching {full_hive_bouts} full hive bouts.")
-            break
+
+# Advances steps_per_frame steps per rendered frame. render=False runs the episode without
+# drawing even when a display is open
+def run_simulation(world, render=True):
+    global running
+    running = True
+    render = render and not headless
+    clock = None
+    if not headless:
+        clock = pygame.time.Clock()
+
+    print("Simulation started.")
+    start_time = time.time()
+
+    finished = False
+    while running and not finished:
+        if not headless:
+            handle_events(world)
+
+        for _ in range(steps_per_frame if render else unrendered_steps):
+            world.step()
+            finished = world.is_finished()
+            if finished:
+                print(f"Simulation ended after {world.end_reason}.")
+                break
+
+        if render:
+            draw_simulation(world)
+            clock.tick(frame_rate)
 
     print("Simulation finished. Duration:", time.time() - start_time)
-    pygame.quit()
 
-    plot_efficiencies()
+    # Closing the window ends the whole run, not just this episode
+    if not running:
+        pygame.quit()
+        plot_efficiencies(world)
+        sys.exit()
 
-    sys.exit()
+    return calculate_fitness(world)
 
-    return random.random()
 
+def plot_efficiencies(world):
+    import matplotlib.pyplot as plt
+    print("Foraging efficiency:", world.foraging_efficiency.summary())
+    print("Search efficiency:", world.search_efficiency.summary())
 
-def plot_efficiencies():
     plt.figure(figsize=(10, 6))
-    plt.plot(foraging_efficiency,
+    plt.plot(list(world.foraging_efficiency),
              label='Foraging Efficiency (Nectar Collected per Bout)', color='blue')
     plt.xlabel('Data Points - Full Hive Bouts')
     plt.ylabel('Foraging Efficiency')
@@ -977,7 +2330,7 @@ def plot_efficiencies():
     plt.show()
 
     plt.figure(figsize=(10, 6))
-    plt.plot(search_efficiency,
+    plt.plot(list(world.search_efficiency),
              label='Search Efficiency (Flowers Visited per Distance)', color='green')
     plt.xlabel('Data Points - Full Hive Bouts')
     plt.ylabel('Search Efficiency')
@@ -987,13 +2340,189 @@ def plot_efficiencies():
     plt.show()
 
 
-# Load NEAT configuration
-local_dir = os.path.dirname(__file__)
-config_path = os.path.join(local_dir, "config-feedforward")
-config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction,
-                            neat.DefaultSpeciesSet, neat.DefaultStagnation,
-                            config_path)
+# NEAT configuration, parsed on first use rather than at import
+config_path = os.path.join(os.path.dirname(__file__), "config-feedforward")
+config = None
+
+
+def load_config(path=None):
+    global config
+    if config is None or path is not None:
+        config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                                    neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                                    path or config_path)
+    return config
+
+
+array_types = ('random', 'positive', 'independent', 'negative',
+               'positive_v2', 'independent_v2', 'negative_v2')
+
+# Command-line toggles and the World attribute each one enables
+environment_toggles = {
+    'weather_changes': 'weather_changes_enabled',
+    'rain': 'rain_enabled',
+    'obstacles': 'obstacles_enabled',
+    'random_obstacles': 'random_obstacles_enabled',
+    'spawn_despawn': 'random_spawn_despawn_enabled',
+    'dying_flowers': 'dying_flowers_enabled',
+    'spawn_flowers': 'random_spawn_flowers_enabled',
+}
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Evolve bumblebee foraging networks with NEAT, or evaluate a saved genome.")
+
+    episode = parser.add_argument_group("episode")
+    episode.add_argument("--flowers", type=int, default=15, help="normal flowers per episode")
+    episode.add_argument("--special", type=int, default=0, help="special flowers per episode")
+    episode.add_argument("--bees", type=int, default=10, help="bees per episode")
+    episode.add_argument("--array-type", choices=array_types, default='random',
+                         help="flower layout")
+    episode.add_argument("--target-bouts", type=int, default=10,
+                         help="full hive bouts that end an episode")
+    episode.add_argument("--max-steps", type=int, default=30000, help="tick budget per episode")
+    episode.add_argument("--engine", choices=('object', 'vectorized'), default='object',
+                         help="bee simulation engine")
+    episode.add_argument("--vectorized", dest='engine', action='store_const', const='vectorized',
+                         help="shorthand for --engine vectorized")
+    episode.add_argument("--seed", type=int, help="seed for flower layouts and evolution")
+
+    scoring = parser.add_argument_group("scoring")
+    scoring.add_argument("--eval-seeds", type=int, nargs='+', metavar="SEED",
+                         help="score every genome on each of these layout seeds (default: --seed)")
+    scoring.add_argument("--array-types", choices=array_types, nargs='+', metavar="TYPE",
+                         help="score every genome on each of these layouts (default: --array-type)")
+    scoring.add_argument("--aggregate", choices=('mean', 'min', 'quantile'), default='mean',
+                         help="how the scenario fitnesses combine into a genome's fitness")
+    scoring.add_argument("--quantile", type=float, default=0.25,
+                         help="quantile used by --aggregate quantile")
+
+    environment = parser.add_argument_group("environment")
+    for toggle in environment_toggles:
+        environment.add_argument("--" + toggle.replace('_', '-'), action='store_true',
+                                 help=f"enable {toggle.replace('_', ' ')}")
+
+    evolution = parser.add_argument_group("evolution")
+    evolution.add_argument("--generations", type=int, default=50,
+                           help="total generations, including resumed ones")
+    evolution.add_argument("--workers", type=int,
+                           help="evaluation processes (headless only; default: CPU count)")
+    evolution.add_argument("--config", default=config_path,
+                           help="NEAT configuration file")
+    evolution.add_argument("--checkpoint-dir", help="save a checkpoint here every generation")
+    evolution.add_argument("--resume", nargs='?', const=True, metavar="CHECKPOINT",
+                           help="continue from CHECKPOINT, or from the latest checkpoint in --checkpoint-dir")
+    evolution.add_argument("--save-winner", metavar="FILE", help="pickle the best genome to FILE")
+    evolution.add_argument("--evaluate", metavar="FILE",
+                           help="run one episode with a saved genome or checkpoint instead of evolving")
+
+    output = parser.add_argument_group("output")
+    output.add_argument("--headless", action='store_true',
+                        help="run without the pygame display, Tk panel or frame cap")
+    output.add_argument("--log-dir", help="write generation, genome and bout CSV logs here")
+    output.add_argument("--fps", type=int, default=30, help="rendered frames per second")
+    output.add_argument("--steps-per-frame", type=int, default=1,
+                        help="simulation steps per rendered frame (Right/Left arrows double/halve it)")
+    output.add_argument("--render-every-genome", type=int, default=1, metavar="K",
+                        help="draw only every K-th genome of a generation")
+    output.add_argument("--render-every-generation", type=int, default=1, metavar="K",
+                        help="draw only every K-th generation")
+
+    args = parser.parse_args(argv)
+    if not 0 <= args.quantile <= 1:
+        parser.error(f"--quantile must be between 0 and 1, got {args.quantile}")
+    if args.resume is True:
+        if args.checkpoint_dir is None or not os.path.isdir(args.checkpoint_dir):
+            parser.error("--resume without a CHECKPOINT needs an existing --checkpoint-dir")
+        args.resume = latest_checkpoint(args.checkpoint_dir)
+        if args.resume is None:
+            parser.error(f"no checkpoint to resume from in {args.checkpoint_dir}")
+    elif args.resume is not None and not os.path.isfile(args.resume):
+        parser.error(f"checkpoint {args.resume} does not exist")
+    return args
+
+
+def main(argv=None):
+    global headless, num_workers, world, run_log, scenarios, fitness_aggregation, fitness_quantile
+    global frame_rate, steps_per_frame, render_genome_interval, render_generation_interval
+
+    args = parse_arguments(argv)
+    headless = args.headless
+    num_workers = (args.workers or os.cpu_count()) if headless else 1
+
+    world_settings.update(engine=args.engine, seed=args.seed)
+    episode_settings.update(num_flowers=args.flowers, num_special_flowers=args.special,
+                            num_bees=args.bees, array_type=args.array_type)
+    scenarios = [(seed, array_type)
+                 for array_type in args.array_types or [args.array_type]
+                 for seed in args.eval_seeds or [args.seed]]
+    fitness_aggregation = args.aggregate
+    fitness_quantile = args.quantile
+    frame_rate = args.fps
+    steps_per_frame = max(1, min(args.steps_per_frame, max_steps_per_frame))
+    render_genome_interval = max(1, args.render_every_genome)
+    render_generation_interval = max(1, args.render_every_generation)
+    environment_settings.update(target_full_hive_bouts=args.target_bouts, max_steps=args.max_steps)
+    environment_settings.update((attribute, getattr(args, toggle))
+                                for toggle, attribute in environment_toggles.items())
+
+    if args.seed is not None:
+        random.seed(args.seed)
+        np.random.seed(args.seed)
+
+    load_config(args.config)
+
+    if not headless:
+        world = create_world()
+        init_display()
+        tk_thread = threading.Thread(target=configure_simulation, args=(world,))
+        tk_thread.daemon = True
+        tk_thread.start()
+
+    if args.log_dir is not None:
+        run_log = RunLogWriter(args.log_dir)
+
+    if args.evaluate is not None:
+        genome = load_genome(args.evaluate)
+        results = [run_episode(genome, config, world, scenario) for scenario in scenarios]
+        record_genome(genome.key, genome, results)
+        for fitness, summary, bout_log in results:
+            print("Episode summary:", summary)
+    else:
+        evolve(args)
+
+    if run_log is not None:
+        run_log.close()
+
+    if not headless:
+        pygame.quit()
+        plot_efficiencies(world)
+
+
+def evolve(args):
+    if args.resume is not None:
+        population = restore_evolution(args.resume)
+    else:
+        population = neat.Population(config)
+
+    if args.checkpoint_dir is not None:
+        checkpointer = EvolutionCheckpointer(args.checkpoint_dir, population.reproduction)
+        checkpointer.best_genome = population.best_genome
+        population.add_reporter(checkpointer)
+
+    remaining_generations = max(0, args.generations - generation)
+    if num_workers > 1:
+        evaluator = ParallelGenomeEvaluator(num_workers)
+        winner = population.run(evaluator.evaluate, remaining_generations)
+        evaluator.close()
+    else:
+        winner = population.run(eval_genomes, remaining_generations)
+
+    if args.save_winner is not None:
+        save_genome(population.best_genome or winner, args.save_winner)
+        print(f"Saved best genome to {args.save_winner}")
 
-population = neat.Population(config)
 
-population.run(eval_genomes, 50)
+if __name__ == "__main__":
+    main()